@@ -21,16 +21,61 @@
 # CSDevs. If not, see <https://www.gnu.org/licenses/>.
 #
 
+import hashlib
 import os
+import pickle
+import sys
 import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
 
-from PySide6.QtCore import (QDirIterator, QLoggingCategory, QStandardPaths,
-                            qCDebug, qCWarning)
+from PySide6.QtCore import (QLoggingCategory, QStandardPaths, qCDebug,
+                            qCWarning)
 from PySide6.QtGui import (QFont, QFontDatabase, QRawFont)
 
 # from csdMessages import (disable_warnings, enable_warnings, disable_debug,
 #                         enable_debug, warning_message, debug_message)
 
+# Levels of match of a font file to a requested family, weight and style, see
+# CSAllFonts.__font_attr_match()
+MATCH_NONE = 0
+MATCH_NAME = 1
+MATCH_NAME_AND_STYLE = 2
+
+
+def _standard_weight_ranges():
+    '''
+    Get the range of weights centered on each QFont standard weight, from the
+    mid-point with the previous standard weight to the mid-point with the next
+    standard weight. The lowest range starts at the minimum weight (1) and the
+    highest range ends at the maximum weight (1000).
+
+    Returns a tuple of (lower mid-point, upper mid-point) tuples in increasing
+    standard weight order: Thin, ExtraLight, Light, Normal, Medium, DemiBold,
+    Bold, ExtraBold, Black.
+    '''
+
+    weights = (QFont.Thin, QFont.ExtraLight, QFont.Light, QFont.Normal,
+               QFont.Medium, QFont.DemiBold, QFont.Bold, QFont.ExtraBold,
+               QFont.Black)
+
+    ranges = []
+    for i, centerWeight in enumerate(weights):
+        # Don't use mid-point under lowest standard and mid-point over highest
+        # standard
+        if i > 0:
+            loMid = centerWeight - int((centerWeight - weights[i - 1]) / 2)
+        else:
+            loMid = 1
+        if i < (len(weights) - 1):
+            hiMid = centerWeight + int((weights[i + 1] - centerWeight) / 2)
+        else:
+            hiMid = 1000
+        ranges.append((loMid, hiMid))
+
+    return tuple(ranges)
+
 
 class CSAllFonts:
     '''
@@ -51,20 +96,32 @@ class CSAllFonts:
     '''
     Lists of discovered fonts:
         unloadable: those that cannot be loaded as a QRawFont, their family
-            name identified and found in the QFontDatabase
-        accounted: those that can be loaded as a QRawFont, their family name
-            identified and found in the QFontDatabase. It's a list of tuples
-            with family name, path of font file, style of font and weight of
-            font.
-        familyToPath: a dictionary of family names to path names. Key is font
-            family name and items are tuples of path of font file, style of font
-            and weight of font
-        allFamiliesToPath: a dictionary currently unused.
+            name identified and found in the QFontDatabase. It's a dictionary
+            of font file path to a tuple of the file's modification time
+            (st_mtime_ns) and size when it was found unloadable.
+        dbCount: the number of font files that can be loaded as a QRawFont,
+            their family name identified and found in the QFontDatabase
+
+    Those font files are kept as parallel columns, one row per file in the
+    order found, created in the constructor:
+        _families: list of font family names
+        _paths: list of font file paths
+        _styles: list of font styles (QFont.Style values)
+        _weights: array of font weights (integers)
+        _fileStyles: array of masks of the fontStyles in each font filename,
+            bit n is set if fontStyles[n] is in the filename
+        _familyRows: a dictionary of case-folded family names to the list of
+            rows of the family's files, the first is the first file found for
+            the family. Qt matches family names without regard to case.
+        _familyDisplay: a dictionary of case-folded family names to the family
+            name of the first file found for the family
+        _exactIndex: a dictionary of (case-folded family name, weight, style)
+            to the row found for an exact weight lookup of them, see
+            __find_font_file()
+        _inexactFamilies: a set of case-folded family names having a file
+            without weight or style that can't use _exactIndex
     '''
-    unloadable = []
-    accounted = []
-    familyToPath = {}
-    allFamiliesToPath = {}
+    unloadable = {}
     dbCount = 0
 
     '''
@@ -72,6 +129,20 @@ class CSAllFonts:
     '''
     fontIDs = [".ttf", ".otf", ".otb", ".pfs", ".pfb", ".pcf.gz", ".pcf"]
 
+    '''
+    The same extensions without the dot, lowercase, for a single hash lookup of
+    the last extension of a filename. ".pcf.gz" has two extensions so it is
+    tested for separately, see __is_font_filename()
+    '''
+    fontExts = frozenset(["ttf", "otf", "otb", "pfs", "pfb", "pcf"])
+
+    '''
+    Names of directories not walked when scanning font directories, they are
+    known not to hold font files. Hidden directories (name starting with a dot)
+    are also not walked.
+    '''
+    skipDirNames = frozenset(["__pycache__", "conf.d", "conf.avail"])
+
     '''
     Common font style names used on linux font filenames to identify font weight
     instead of actual graphical library object. For example, a font filename
@@ -83,9 +154,28 @@ class CSAllFonts:
     '''
     fontStyles = ["Thin", "ExtraLight", "Light", "Regular", "Medium",\
                   "DemiBold", "Bold", "ExtraBold", "Black"]
-    matchNone = 0
-    matchName = 1
-    matchNameAndStyle = 2
+
+    '''
+    Weight range (lower mid-point, upper mid-point, style name) for each
+    standard weight, in the order of fontStyles, and the upper mid-points alone
+    to bisect a weight into its range. See standard_weight_fit(). A weight
+    below all ranges uses the first range and a weight above all ranges uses
+    the last range.
+    '''
+    styleTable = tuple(r + (n,) for r, n in zip(_standard_weight_ranges(),
+                                                fontStyles))
+    styleHiBounds = tuple(r[1] for r in styleTable)
+    lastStyleIndex = len(fontStyles) - 1
+    matchNone = MATCH_NONE
+    matchName = MATCH_NAME
+    matchNameAndStyle = MATCH_NAME_AND_STYLE
+
+    '''
+    Name of the file, in the application cache location, that the font lists
+    are saved in so that they don't need to be rebuilt at every start
+    '''
+    cacheFilename = "csdevs_fonts.pkl"
+    cacheVersion = 4
 
     logCategory = QLoggingCategory("csdevs.fonts.all")
 
@@ -93,10 +183,165 @@ class CSAllFonts:
         '''
         Constructor, loads the list and dictionary of fonts
         '''
+
+        # One raw font is re-loaded for every font file examined rather than
+        # creating one per file
+        self._rawFont = QRawFont()
+
+        # QFontDatabase.hasFamily() results by family name, many font files
+        # share a family and the database check isn't cheap
+        self._hasFamilyCache = {}
+
+        # Unloadable font files from a previous scan. A file that is unchanged
+        # since it was found unloadable is not loaded again. Their current
+        # modification time and size are read while walking the directories.
+        self._unloadableCache = {}
+        self._unloadableStamps = {}
+
+        # Results of font_file_for_font_family_filtered() by its parameters
+        # and whether matches were found since the font cache was saved
+        self._matchCache = {}
+        self._matchCacheChanged = False
+
+        # Results of standard_weight_fit() by font weight, there are only a
+        # few distinct weights in the font files
+        self._weightFitCache = {}
+
+        # Modification times of the font directories scanned for the font
+        # lists, tuples of the directory path and st_mtime_ns (None when the
+        # directory couldn't be accessed)
+        self._fontDirTimes = []
+
+        # Font file columns, see the class description
+        self._families = []
+        self._paths = []
+        self._styles = []
+        self._weights = array('i')
+        self._fileStyles = array('H')
+        self._familyRows = {}
+        self._familyDisplay = {}
+        self._exactIndex = {}
+        self._inexactFamilies = set()
+
+        # Font files found by the last scan that haven't been loaded as a
+        # QRawFont yet and the font directories they were found in
+        self._pending = []
+        self._fontTopPaths = []
+
         # families = QFontDatabase.families()
         # debug_message("All known font families before parsing files: {}".format(len(families)))
         self.load_font_lists()
 
+    def __is_font_filename(self, fName):
+        '''
+        Check if a filename has a file extension expected for a font. Only the
+        name is examined, the file is not accessed.
+
+        Parameters
+        ----------
+            fName: string
+                Contains the name of a file, with or without a path
+
+        Returns True if the filename extension is one in the fontIDs member
+        (in any case), else returns False.
+        '''
+
+        name = fName.lower()
+        return name.endswith(".pcf.gz") or\
+            (name.rpartition(".")[2] in self.fontExts)
+
+    def __account_font(self, family, fontPath, fontStyle, fontWeight):
+        '''
+        Add a row to the font file columns
+
+        Parameters
+        ----------
+            family: string
+                Contains the font family name
+            fontPath: string
+                Contains the name of the font file
+            fontStyle: QFont.Style
+                The style of the font
+            fontWeight: integer
+                The weight of the font
+        '''
+
+        # Many files share a family name, keep one copy of it
+        family = sys.intern(family)
+        familyKey = sys.intern(family.casefold())
+
+        # The first row for a family is it's default file
+        row = len(self._families)
+        familyRows = self._familyRows.get(familyKey)
+        if familyRows is None:
+            self._familyRows[familyKey] = [row]
+            self._familyDisplay[familyKey] = family
+        else:
+            familyRows.append(row)
+
+        # Index the row for exact weight lookups. The search prefers the last
+        # of the other rows that match but the first file if it matches too.
+        if (fontWeight > 0) and (fontStyle is not None):
+            if familyRows is not None:
+                firstRow = familyRows[0]
+                if (self._weights[firstRow] == fontWeight) and\
+                        (self._styles[firstRow] == fontStyle):
+                    exactRow = firstRow
+                else:
+                    exactRow = row
+                self._exactIndex[(familyKey, fontWeight, fontStyle)] = exactRow
+        else:
+            # Could match any weight or style by it's filename
+            self._inexactFamilies.add(familyKey)
+
+        self._families.append(family)
+        self._paths.append(fontPath)
+        self._styles.append(fontStyle)
+        self._weights.append(fontWeight)
+        self._fileStyles.append(self.__file_style_mask(fontPath))
+
+    def __font_file_stamp(self, fontPath):
+        '''
+        Get the modification time and size of a font file
+
+        Parameters
+        ----------
+            fontPath: string
+                Contains the name of the font file
+
+        Returns a tuple of the file's st_mtime_ns and st_size or None if the
+        file can't be accessed
+        '''
+
+        try:
+            st = os.stat(fontPath)
+        except OSError:
+            return None
+
+        return (st.st_mtime_ns, st.st_size)
+
+    def __font_file_digest(self, fontPath):
+        '''
+        Get a fingerprint of the start of a font file to recognize copies of
+        the same font under different names. For a font it holds the header and
+        the table directory with the length and checksum of every table.
+
+        Parameters
+        ----------
+            fontPath: string
+                Contains the name of the font file
+
+        Returns a digest of the first 4 KiB of the file or None if the file
+        can't be read
+        '''
+
+        try:
+            with open(fontPath, "rb") as fontFile:
+                return hashlib.blake2b(fontFile.read(4096),
+                                       digest_size=16).digest()
+        except OSError:
+            return None
+
     def __track_font_file(self, fontPath):
         '''
         Verify if a file is a font and has a family in the QFontDatabase then
@@ -106,40 +351,39 @@ class CSAllFonts:
         Parameters
         ----------
             fontPath: string
-                Contains the name of a file assumed to be a font
-        '''
-
-        # Does the file have a file extension expected for a font
-        for aFmt in self.fontIDs:
-            if fontPath.endswith(aFmt):
-                # Get a raw font from the file and get it's family
-                aFont = QRawFont()
-                aFont.loadFromFile(fontPath, 16,
-                                   QFont.PreferDefaultHinting)
-                fontFamily = aFont.familyName()
-
-                # Does the family exist in the database
-                if QFontDatabase.hasFamily(fontFamily):
-                    self.dbCount += 1
-                    # If we already know it then account more attributes
-                    if fontFamily in self.familyToPath:
-                        # Already accounted for as a family name but
-                        # account more attributes
-                        self.accounted.append((fontFamily, fontPath,
-                                               aFont.style(),
-                                               aFont.weight()))
-                    else:
-                        # Family not seen yet, log it keyed by
-                        # family name
-                        self.familyToPath[fontFamily] = (fontPath,
-                                                         aFont.style(),
-                                                         aFont.weight())
-                else:
-                    # Failed to add to the font database
-                    self.unloadable.append(fontPath)
+                Contains the name of a file assumed to be a font, it has a
+                filename extension expected for a font, see
+                __is_font_filename()
+        '''
 
-                # Used the file extension loop to a conclusion
-                break
+        # Skip a file known to be unloadable if it hasn't changed since
+        knownBad = self._unloadableCache.get(fontPath)
+        if knownBad is not None:
+            stamp = self._unloadableStamps.get(fontPath)
+            if stamp is None:
+                stamp = self.__font_file_stamp(fontPath)
+            if knownBad == stamp:
+                self.unloadable[fontPath] = knownBad
+                return
+
+        # Load the file in the shared raw font and get it's family
+        aFont = self._rawFont
+        aFont.loadFromFile(fontPath, 16, QFont.PreferDefaultHinting)
+        fontFamily = aFont.familyName()
+
+        # Does the family exist in the database
+        inDatabase = self._hasFamilyCache.get(fontFamily)
+        if inDatabase is None:
+            inDatabase = QFontDatabase.hasFamily(fontFamily)
+            self._hasFamilyCache[fontFamily] = inDatabase
+
+        if inDatabase:
+            self.dbCount += 1
+            self.__account_font(fontFamily, fontPath, aFont.style(),
+                                aFont.weight())
+        else:
+            # Failed to add to the font database
+            self.unloadable[fontPath] = self.__font_file_stamp(fontPath)
 
     def __add_to_font_database(self, fontPath):
         '''
@@ -151,238 +395,448 @@ class CSAllFonts:
         Parameters
         ----------
             fontPath: string
-                Contains the name of a file assumed to be a font
-        '''
-
-        # Does the file have a file extension expected for a font
-        for aFmt in self.fontIDs:
-            if fontPath.endswith(aFmt):
-                idx = QFontDatabase.addApplicationFont(fontPath)
-                if idx >= 0:
-                    # Use a raw font to get default attributes
-                    aFont = QRawFont()
-                    aFont.loadFromFile(fontPath, 16,
-                                       QFont.PreferDefaultHinting)
-
-                    # Go through all font database family names in the added font
-                    names = QFontDatabase.applicationFontFamilies(idx)
-                    for n in names:
-                        self.dbCount += 1
-                        if n in self.familyToPath:
-                            # Already accounted for as a family name but
-                            # account more attributes
-                            self.accounted.append((n, fontPath,
-                                                   aFont.style(),
-                                                   aFont.weight()))
-                        else:
-                            # Family not seen yet, log it keyed by
-                            # family name
-                            self.familyToPath[n] = (fontPath,
-                                                    aFont.style(),
-                                                    aFont.weight())
-                else:
-                    # Failed to add to the font database
-                    self.unloadable.append(fontPath)
-
-                # Used the file extension loop to a conclusion
-                break
-
-    def __scanFontPath(self, aPath):
-        '''
-        This is very slow, os.walk() is a few seconds faster than recursive
-        os.scandir(). It's best to use this and initialize a class instance
-        which is not (or is rarely) re-initialized, font install/remove is not
-        frequent. It's then faster to look up a choice of font filename from the
-        initialized instance. Use the member
-        font_file_for_font_family_filtered() to find a font filename with
-        restricted styles, e.g. not bold, not italic because there can be
-        multiple font files to cover available styles for any family.
-        font_file_for_font_family() only gives the first file found for the
-        requested family, with no style restrictions. Use of yieldCurrentThread
-        appears to either reduce the impact or, indeed, make this faster.
+                Contains the name of a file assumed to be a font, it has a
+                filename extension expected for a font, see
+                __is_font_filename()
+        '''
+
+        idx = QFontDatabase.addApplicationFont(fontPath)
+        if idx >= 0:
+            # Use a raw font to get default attributes
+            aFont = QRawFont()
+            aFont.loadFromFile(fontPath, 16, QFont.PreferDefaultHinting)
+
+            # Go through all font database family names in the added font
+            names = QFontDatabase.applicationFontFamilies(idx)
+            fontStyle = aFont.style()
+            fontWeight = aFont.weight()
+            for n in names:
+                self.dbCount += 1
+                self.__account_font(n, fontPath, fontStyle, fontWeight)
+        else:
+            # Failed to add to the font database
+            self.unloadable[fontPath] = self.__font_file_stamp(fontPath)
+
+    def __collect_font_paths(self, aPath):
+        '''
+        Walk a font directory tree and list the files in it that have a font
+        filename extension. Nothing is loaded from the files and no Qt object
+        is used so that the walks of separate font directories can run in
+        parallel threads, see load_font_lists(). Files previously found
+        unloadable are also stat'ed here, so those waits overlap across the
+        threads too.
+
+        The tree is walked iteratively with os.scandir() and an explicit stack
+        of directories still to be scanned. The directory entries carry the
+        file type from the directory read itself so, unlike os.walk() or
+        QDirIterator, there is no stat() per entry to decide if it's a file or
+        a directory and the entry already has the full path.
 
         Parameters
         ----------
             aPath: string
                 Contains the name of a directory to scan for font files
+
+        Each font file is stat'ed once for its device, inode and size. A file
+        found more than once (through a link or overlapping font directories)
+        is only loaded once by device and inode, the size finds the few files
+        that could be copies of each other, see __font_file_digest().
+
+        Returns a tuple of a list of the font file paths found, a list of
+        tuples of each directory walked and its modification time (None if it
+        couldn't be accessed), a dictionary of previously unloadable font file
+        paths found to their current modification time and size and a list of
+        (device, inode, size) tuples identifying each font file path found.
         '''
 
-        try:
-            lastYield = time.time()
-            t0 = lastYield
-            yieldLimit = 0.4
-            yieldCount = 0
-            for root, dirs, files in os.walk(aPath):
-                # Some of the "files" values cause a ValueError if accessed, so
-                # use a length limited loop with exception handling to continue
-                # past them. j is the successfully acessed count, k the count of
-                # accesses that caused exceptions. The sum j + k is current
-                # index
-                i = len(files)
-                j = 0
-                k = 0
-                while i > (j + k):
-                    try:
-                        aName = files[j + k]
-                        j += 1
-                        if not aName.startswith('.'):
-                            t0 = time.time()
-                            if (t0 - lastYield) >= yieldLimit:
-                                self.yieldCurrentThread()
-                                yieldCount += 1
-                                lastYield = t0
-                            try:
-                                # The file may not be a font and we should get
-                                # an exception in some cases
-                                fontPath = os.path.join(root, aName)
-                                # self.__add_to_font_database(fontPath)
-                                self.__track_font_file(fontPath)
-                            except:
-                                # Parsing the path to font database or using it
-                                # as a raw font failed, try the next entry
+        fontPaths = []
+        fileIDs = []
+        dirTimes = []
+        badStamps = {}
+        knownBad = self._unloadableCache
+
+        dirStack = [aPath]
+        while dirStack:
+            curPath = dirStack.pop()
+            try:
+                # Record the directory time, adding or removing anything in it
+                # changes it and makes any saved font lists out of date
+                try:
+                    dirTime = os.stat(curPath).st_mtime_ns
+                except OSError:
+                    dirTime = None
+                dirTimes.append((curPath, dirTime))
+
+                with os.scandir(curPath) as it:
+                    for entry in it:
+                        try:
+                            # Hidden entries, no system call needed to check
+                            if entry.name.startswith('.'):
                                 continue
-                    except Exception as e:
-                        msg = "Iterate {} files from {} failed at {}"
-                        qCWarning(self.logCategory, msg)
-                        qCDebug(self.logCategory,
-                                "Failure is {}".format(type(e)))
-                        # debug_message(msg.format(aPath, j + k))
-                        # debug_message(
-                        k += 1
-        except:
-            # Starting scan of the supplied directory failed, stop the exception
-            # but don't fail or report it. Standard font directories aren't
-            # required to contain anything and some are usually empty.
-            pass
-
-    # This is very slow so is best used to initialize an instance which is much
-    # faster to look up a choice of font filename from. Use the member
-    # font_file_for_font_family_filtered() to find a font filename with restricted
-    # attributes, e.g. not bold, not italic because there can be multiple
-    # font files for the same family to get the individual styles and
-    # font_file_for_font_family() only gives the first file found for the requested
-    # family, with no style restrictions.
-    def __scanFontPathB(self, aPath):
-        lastYield = time.time()
-        t0 = lastYield
-        yieldLimit = 0.4
-        yieldCount = 0
-        try:
-            # Scan path
-            with os.scandir(aPath) as it:
-                for entry in it:
-                    try:
-                        if not entry.name.startswith('.'):
-                            if entry.is_file():
-                                t0 = time.time()
-                                if (t0 - lastYield) >= yieldLimit:
-                                    self.yieldCurrentThread()
-                                    yieldCount += 1
-                                    lastYield = t0
-                                try:
-                                    # Create a fully qualified filename
-                                    fontPath = os.path.join(aPath, entry.name)
-                                    # self.__add_to_font_database(fontPath)
-                                    self.__track_font_file(fontPath)
-                                except:
-                                    # Parsing the path to font database failed,
-                                    # try the next entry
-                                    continue
-                            elif entry.is_dir():
-                                # Append directory name to path so-far and
-                                # re-call ourselves to parse the new directory
-                                newPath = aPath + "/" + entry.name
-                                self.__scanFontPathB(newPath)
-                    except:
-                        # Parsing a directory entry failed, try the next
-                        continue
-        except:
-            # Start scanning the supplied directory failed, stop
-            pass
-
-    # 2022/10/11: At least one python 3.10 has os.scandir() that returns
-    # DirEntry objects that raise an AttributeError when entry.name is
-    # accessed. Repeat the __scanFontPath implementation using Qt objects.
-    # This version is probably the slowest, although the number of files ignored
-    # by the raising of AttributeError might make the os.scandir() version only
-    # appear faster
-    def __scanFontPathQt(self, aPath):
+
+                            # Don't follow directory links, they can loop.
+                            # Don't walk directories known to have no fonts.
+                            if entry.is_dir(follow_symlinks=False):
+                                if entry.name not in self.skipDirNames:
+                                    dirStack.append(entry.path)
+                            elif entry.is_file() and\
+                                    self.__is_font_filename(entry.name):
+                                st = entry.stat()
+                                fontPath = entry.path
+                                fontPaths.append(fontPath)
+                                fileIDs.append((st.st_dev, st.st_ino,
+                                                st.st_size))
+                                if fontPath in knownBad:
+                                    badStamps[fontPath] = (st.st_mtime_ns,
+                                                           st.st_size)
+                        except (OSError, AttributeError):
+                            # 2022/10/11: At least one python 3.10 has
+                            # os.scandir() that returns DirEntry objects that
+                            # raise an AttributeError when entry.name is
+                            # accessed. An entry can also be removed while
+                            # being checked. Try the next entry.
+                            continue
+            except OSError:
+                # Starting scan of the directory failed, stop the exception but
+                # don't fail or report it. Standard font directories aren't
+                # required to contain anything and some are usually empty.
+                pass
+
+        return (fontPaths, dirTimes, badStamps, fileIDs)
+
+    def __track_font_files(self, fontPaths):
+        '''
+        This is slow, it's best used to initialize a class instance which is
+        not (or is rarely) re-initialized, font install/remove is not frequent.
+        It's then faster to look up a choice of font filename from the
+        initialized instance. Use the member font_file_for_font_family_filtered()
+        to find a font filename with restricted styles, e.g. not bold, not
+        italic because there can be multiple font files to cover available
+        styles for any family. font_file_for_font_family() only gives the first
+        file found for the requested family, with no style restrictions.
+
+        Must be used in the thread that owns the Qt font objects.
+
+        Parameters
+        ----------
+            fontPaths: list
+                Contains the names of files with a font filename extension, see
+                __collect_font_paths()
+        '''
+
         lastYield = time.time()
         yieldLimit = 0.4
-        yieldCount = 0
-
-        # Iterate from the supplied top-level directory recursively
-        it = QDirIterator(aPath, QDirIterator.Subdirectories)
-        while it.hasNext():
-            fInfo = it.nextFileInfo()
-            fName = it.fileName()
-
-            # Only handle files that are not hidden
-            if fInfo.isFile() and not fName.startswith("."):
-                # self.__add_to_font_database(fInfo.filePath())
-                # If it's a font and in the QFontDatabase keep track of the
-                # relationship with the database entry and the full file path
-                self.__track_font_file(fInfo.filePath())
-
-                # Yield from time to time
+
+        for nFile, fontPath in enumerate(fontPaths):
+            # Yield from time to time, only read the clock every 512 files
+            if (nFile & 511) == 0:
                 tNow = time.time()
-                if (tNow - lastYield) > yieldLimit:
+                if (tNow - lastYield) >= yieldLimit:
                     time.sleep(0)
-                    yieldCount += 1
                     lastYield = tNow
 
+            try:
+                # The file may not be a font and we should get an exception in
+                # some cases
+                self.__track_font_file(fontPath)
+            except (OSError, AttributeError) as e:
+                # Using it as a raw font failed, try the next file. Only a
+                # debug message, there can be many in a large font tree.
+                qCDebug(self.logCategory,
+                        "Font file {} not used: {}".format(fontPath, e))
+                continue
+
     def __clear_font_lists(self):
         '''
         Reset the font lists, dictionary and font count to no fonts
         '''
 
+        # Keep the unloadable files for the next scan to check
+        if len(self.unloadable) > 0:
+            self._unloadableCache = dict(self.unloadable)
         self.unloadable.clear()
-        self.familyToPath.clear()
-        self.accounted.clear()
+        self._families = []
+        self._paths = []
+        self._styles = []
+        self._weights = array('i')
+        self._fileStyles = array('H')
+        self._familyRows = {}
+        self._familyDisplay = {}
+        self._exactIndex = {}
+        self._inexactFamilies = set()
+        self._pending = []
+        self._unloadableStamps = {}
+        self._hasFamilyCache.clear()
+        self._matchCache.clear()
+        self._matchCacheChanged = False
+        self._fontDirTimes = []
 
         self.dbCount = 0
 
-    def load_font_lists(self):
+    def __font_cache_path(self):
         '''
-        Load the font lists, dictionary and count with information found in
-        font directories
+        Get the name of the file used to save the font lists in
+
+        Returns a string containing the fully qualified filename or None if
+        there is no cache location to use
         '''
 
-        msg = "Gathering system font data, this can take a while..."
+        cacheDir = QStandardPaths.writableLocation(QStandardPaths.CacheLocation)
+        if cacheDir == "":
+            return None
+
+        return os.path.join(cacheDir, self.cacheFilename)
+
+    def __font_dirs_unchanged(self, dirTimes):
+        '''
+        Check if all the directories in a list of font directories and their
+        modification times still have the same modification time
+
+        Parameters
+        ----------
+            dirTimes: list
+                Contains tuples of directory path and st_mtime_ns, or None for a
+                directory that couldn't be accessed
+
+        Returns True if every directory has the same modification time (or is
+        still inaccessible), else returns False.
+        '''
+
+        for dirPath, dirTime in dirTimes:
+            try:
+                curTime = os.stat(dirPath).st_mtime_ns
+            except OSError:
+                curTime = None
+            if curTime != dirTime:
+                return False
+
+        return True
+
+    def __load_font_cache(self, fPaths):
+        '''
+        Load the font lists from the cache file if it was saved from a scan of
+        the same font directories and none of the scanned directories have been
+        modified since
+
+        Parameters
+        ----------
+            fPaths: list
+                Contains the names of the top-level font directories
+
+        Returns True if the font lists were loaded, else returns False and the
+        font lists are unchanged.
+        '''
+
+        cachePath = self.__font_cache_path()
+        if cachePath is None:
+            return False
+
+        try:
+            with open(cachePath, "rb") as cacheFile:
+                cached = pickle.load(cacheFile)
+            version, topPaths, dirTimes, families, paths, styles, weights,\
+                unloadable, dbCount, matchCache = cached
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+                ImportError, TypeError, ValueError):
+            # No cache yet or it can't be used, it will be rebuilt
+            return False
+
+        if version != self.cacheVersion:
+            return False
+
+        if (topPaths != list(fPaths)) or\
+                not self.__font_dirs_unchanged(dirTimes):
+            # Out of date but the unloadable files can still be skipped by the
+            # scan if they haven't changed
+            self._unloadableCache = dict(unloadable)
+            return False
+
+        self.__clear_font_lists()
+        for row in zip(families, paths, styles, weights):
+            self.__account_font(*row)
+        self.unloadable.update(unloadable)
+        self.dbCount = dbCount
+        self._fontDirTimes = dirTimes
+        self._fontTopPaths = topPaths
+        # A font not found may have been installed since, only matches found
+        # are used
+        for key, fontFile in matchCache.items():
+            if fontFile is not None:
+                self._matchCache[key] = fontFile
+
+        return True
+
+    def __save_font_cache(self, fPaths):
+        '''
+        Save the font lists and the results of font lookups made with them to
+        the cache file with the font directory modification times they were
+        built from
+
+        Parameters
+        ----------
+            fPaths: list
+                Contains the names of the top-level font directories
+        '''
+
+        cachePath = self.__font_cache_path()
+        if cachePath is None:
+            return
+
+        # Only lookups that found a font are saved, a font not found now may
+        # be installed before the next start
+        matchCache = {key: fontFile
+                      for key, fontFile in self._matchCache.items()
+                      if fontFile is not None}
+        cached = (self.cacheVersion, list(fPaths), self._fontDirTimes,
+                  self._families, self._paths, self._styles, self._weights,
+                  self.unloadable, self.dbCount, matchCache)
+        tmpPath = cachePath + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+            with open(tmpPath, "wb") as cacheFile:
+                pickle.dump(cached, cacheFile, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpPath, cachePath)
+            self._matchCacheChanged = False
+        except (OSError, pickle.PicklingError, AttributeError,
+                TypeError) as e:
+            qCWarning(self.logCategory,
+                      "Failed to save font lists: {}".format(type(e)))
+
+    def __materialize_fonts(self):
+        '''
+        Load the font files found by the last scan of the font directories and
+        account those with a family in the font database. Nothing is done if
+        they are already loaded.
+        '''
+
+        if len(self._pending) < 1:
+            return
+
+        fontPaths = self._pending
+        self._pending = []
+        # tStart = time.time()
+        self.__track_font_files(fontPaths)
+        self._unloadableStamps = {}
+        # tEnd = time.time()
+        # debug_message("Load all font files took {}s".format(tEnd - tStart))
+        # debug_message("\\ Families: {}, Files: {}, Unloadable: {}".format(len(self._familyRows), len(self._paths), len(self.unloadable)))
+
+        self.__save_font_cache(self._fontTopPaths)
+
+        msg = "Finished gathering system font data. {} ".format(self.dbCount)
+        msg += "font files with family in font database."
         qCDebug(self.logCategory, msg)
         # debug_message(msg)
+        # families = QFontDatabase.families()
+        # debug_message("All known font families after parsing files: {}".format(len(families)))
 
-        # Start with no known font to file mappings
-        self.__clear_font_lists()
+    def load_font_lists(self, force=False, forceMaterialize=False):
+        '''
+        Load the font lists, dictionary and count with information found in
+        font directories. The result of a scan is saved in the application
+        cache location and used instead of scanning again until a font
+        directory is modified.
+
+        A scan only finds the font files, they are loaded as QRawFont and
+        accounted when the font lists are first used.
+
+        Parameters
+        ----------
+            force: boolean
+                If True the font directories are scanned even if saved font
+                lists are up to date
+            forceMaterialize: boolean
+                If True the font files found by a scan are loaded immediately
+                instead of on first use of the font lists
+        '''
 
         # We need to walk all fonts in configuration directories recursively.
         # Each directory is not required to exist or contain any files, it's
         # just a list of potential locations for fonts
         fPaths = QStandardPaths.standardLocations(QStandardPaths.FontsLocation)
 
+        if not force and self.__load_font_cache(fPaths):
+            msg = "Loaded saved system font data. {} ".format(self.dbCount)
+            msg += "font files with family in font database."
+            qCDebug(self.logCategory, msg)
+            return
+
+        msg = "Gathering system font files..."
+        qCDebug(self.logCategory, msg)
+        # debug_message(msg)
+
+        # Start with no known font to file mappings
+        self.__clear_font_lists()
+
+        # Walking the directory trees is system call bound, not python, so
+        # walk each font directory in its own thread. Qt font objects are only
+        # used in the calling thread, when the files found are loaded.
         # tStart = time.time()
-        for aPath in fPaths:
-            self.__scanFontPathQt(aPath)
+        found = []
+        if len(fPaths) > 0:
+            nWorkers = min(8, len(fPaths))
+            with ThreadPoolExecutor(max_workers=nWorkers) as pool:
+                found = list(pool.map(self.__collect_font_paths, fPaths))
+
+        # Keep the first path found for each font file
+        seenIDs = set()
+        uniquePaths = []
+        sizeCounts = {}
+        for fontPaths, dirTimes, badStamps, fileIDs in found:
+            self._fontDirTimes.extend(dirTimes)
+            for fontPath, (fileDev, fileIno, fileSize) in zip(fontPaths,
+                                                              fileIDs):
+                if (fileDev, fileIno) in seenIDs:
+                    continue
+                seenIDs.add((fileDev, fileIno))
+                uniquePaths.append((fontPath, fileSize))
+                sizeCounts[fileSize] = sizeCounts.get(fileSize, 0) + 1
+            self._unloadableStamps.update(badStamps)
+
+        # Keep the first of any copies of a font file under another name. Only
+        # files with the same size as another can be copies, only those are
+        # read.
+        seenDigests = set()
+        for fontPath, fileSize in uniquePaths:
+            if sizeCounts[fileSize] > 1:
+                digest = self.__font_file_digest(fontPath)
+                if digest is not None:
+                    if (fileSize, digest) in seenDigests:
+                        continue
+                    seenDigests.add((fileSize, digest))
+            self._pending.append(fontPath)
+        self._fontTopPaths = list(fPaths)
         # tEnd = time.time()
         # debug_message("Scan all font directory files took {}s".format(tEnd - tStart))
-        # debug_message("\\ Families: {}, Accounted: {}, Unloadable: {}".format(len(self.familyToPath), len(self.accounted), len(self.unloadable)))
 
-        msg = "Finished gathering system font data. {} ".format(self.dbCount)
-        msg += "font files with family in font database."
+        msg = "Found {} system font files.".format(len(self._pending))
         qCDebug(self.logCategory, msg)
         # debug_message(msg)
-        # families = QFontDatabase.families()
-        # debug_message("All known font families after parsing files: {}".format(len(families)))
+
+        if forceMaterialize:
+            self.__materialize_fonts()
+
+    def save_font_lookups(self):
+        '''
+        Save the font lists with the font file lookups that found a font since
+        they were last saved, so the next start doesn't repeat them. Nothing is
+        saved if there are no new lookup results.
+        '''
+
+        if self._matchCacheChanged and (len(self._pending) < 1):
+            self.__save_font_cache(self._fontTopPaths)
 
     def dump_font_paths(self):
         '''
         Debugging function to list the loadable font family and filenames
         '''
 
-        for item, key in enumerate(self.familyToPath):
-            qCDebug(self.logCategory,
-                    "FONT: {} is {}".format(key, self.familyToPath[key]))
-            # debug_message("FONT: {} is {}".format(key, self.familyToPath[key]))
+        for familyKey, rows in self._familyRows.items():
+            key = self._familyDisplay[familyKey]
+            i = rows[0]
+            tFont = (self._paths[i], self._styles[i], self._weights[i])
+            qCDebug(self.logCategory, "FONT: {} is {}".format(key, tFont))
+            # debug_message("FONT: {} is {}".format(key, tFont))
 
     def fontFileForFontFamily(self, family):
         '''
@@ -392,24 +846,24 @@ class CSAllFonts:
         Parameters
         ----------
             family: string
-                Contains the name of a font family
+                Contains the name of a font family, in any case
 
         Errors:
             The result of retrieving a dictionary entry that doesn't exist is
             passed as-is to the caller
         '''
 
+        self.__materialize_fonts()
         # self.dump_font_paths()
-        tFont = self.familyToPath[family]
-        return tFont[0]
+        return self._paths[self._familyRows[family.casefold()][0]]
 
     def standard_weight_fit(self, weight):
         '''
         Get a pair of weights that a given weight is between in QFont standard
         weight names and that are centered on a standard weight with the result
         pair values centered between the standard weight either side of the
-        center we chose. If no match is found then the result equivalent to
-        a QFont.Normal weight is returned so that there is something to use.
+        center we chose. A weight below the lowest range gets the lowest range
+        and a weight above the highest range gets the highest range.
 
         Parameters
         ----------
@@ -447,74 +901,17 @@ class CSAllFonts:
         # the only fraction that can occur is w.5 for which both the loMid and
         # hiMid should round in the same direction, so don't think so
 
-        # We have to try all standard weights until we find one that has
-        # mid-points between the under and over standard weight that contains
-        # the supplied weight
-        weightFit = None
-        centerWeight = QFont.Thin
-        while centerWeight != 1000:
-            # Get the standard weight under and over the current center weight
-            if centerWeight == QFont.Thin:
-                overWeight = QFont.ExtraLight
-            elif centerWeight == QFont.ExtraLight:
-                underWeight = QFont.Thin
-                overWeight = QFont.Light
-            elif centerWeight == QFont.Light:
-                underWeight = QFont.ExtraLight
-                overWeight = QFont.Normal
-            elif centerWeight == QFont.Normal:
-                underWeight = QFont.Light
-                overWeight = QFont.Medium
-            elif centerWeight == QFont.Medium:
-                underWeight = QFont.Normal
-                overWeight = QFont.DemiBold
-            elif centerWeight == QFont.DemiBold:
-                underWeight = QFont.Medium
-                overWeight = QFont.Bold
-            elif centerWeight == QFont.Bold:
-                underWeight = QFont.DemiBold
-                overWeight = QFont.ExtraBold
-            elif centerWeight == QFont.ExtraBold:
-                underWeight = QFont.Bold
-                overWeight = QFont.Black
-            elif centerWeight == QFont.Black:
-                underWeight = QFont.ExtraBold
-
-            # Get the mid-points between under and center also between center
-            # and over
-            # Don't use mid-point under lowest standard and mid-point over
-            # highest standard
-            if centerWeight != QFont.Thin:
-                loMid = centerWeight - int((centerWeight - underWeight) / 2)
-            else:
-                loMid = 1
-            if centerWeight != QFont.Black:
-                hiMid = centerWeight + int((overWeight - centerWeight) / 2)
-            else:
-                hiMid = 1000
-
-            # Check if the supplied weight is within current range
-            if (weight >= loMid) and (weight <= hiMid):
-                # Found, use the mid-points between standard values as the
-                # result and end the loop
-                weightFit = (loMid, hiMid)
-                break
-
-            # Next center weight to test is current over weight
-            centerWeight = overWeight
-
-        # If we have no weight fit found then supplied weight is out-of-range
-        # for all standard weights or otherwise unrecognized, assume normal
-        # FIXME: Should this raise a ValueError exception instead?
-        if weightFit is None:
-            weightFit = self.standard_weight_fit(QFont.Normal)
-
-        return weightFit
+        # Ranges share their end points, the first range containing the weight
+        # is used, i.e. the lowest range with an upper mid-point not below it.
+        # The ranges have no gaps so only a weight over the highest range finds
+        # none, it gets the highest.
+        i = min(bisect_left(self.styleHiBounds, weight), self.lastStyleIndex)
+        return self.styleTable[i][:2]
 
     def __font_weight_style(self, weight):
         '''
         Get the style text we'd expect a font filename to have appended to
-        indicate the given content weight
+        indicate the given content weight, as it's index in fontStyles
 
         This is not an accurate method as a font creator can use any style name
         for any weight but it is reasonably accurate for most fonts.
@@ -524,34 +921,15 @@ class CSAllFonts:
             weight: integer
                 The weight number the style equivalent is wanted for
 
-        Returns a string containing the font style normally used for the
-        supplied weight value. Or returns None if supplied weight doesn't match
-        the weight range of any standard font.
-        '''
-
-        weightFit = self.standard_weight_fit(weight)
-        if (weightFit[0] <= QFont.Thin) and (weightFit[1] >= QFont.Thin):
-            needStyle = self.fontStyles[0]
-        elif (weightFit[0] <= QFont.ExtraLight) and (weightFit[1] >= QFont.ExtraLight):
-            needStyle = self.fontStyles[1]
-        elif (weightFit[0] <= QFont.Light) and (weightFit[1] >= QFont.Light):
-            needStyle = self.fontStyles[2]
-        elif (weightFit[0] <= QFont.Normal) and (weightFit[1] >= QFont.Normal):
-            needStyle = self.fontStyles[3]
-        elif (weightFit[0] <= QFont.Medium) and (weightFit[1] >= QFont.Medium):
-            needStyle = self.fontStyles[4]
-        elif (weightFit[0] <= QFont.DemiBold) and (weightFit[1] >= QFont.DemiBold):
-            needStyle = self.fontStyles[5]
-        elif (weightFit[0] <= QFont.Bold) and (weightFit[1] >= QFont.Bold):
-            needStyle = self.fontStyles[6]
-        elif (weightFit[0] <= QFont.ExtraBold) and (weightFit[1] >= QFont.ExtraBold):
-            needStyle = self.fontStyles[7]
-        elif (weightFit[0] <= QFont.Black) and (weightFit[1] >= QFont.Black):
-            needStyle = self.fontStyles[8]
-        else:
-            needStyle = None
+        Returns an integer index in fontStyles of the font style normally used
+        for the supplied weight value. A weight outside the range of every
+        standard weight gets the style of the nearest range, as for
+        standard_weight_fit().
+        '''
 
-        return needStyle
+        # Same range search as standard_weight_fit(), the ranges are in the
+        # order of fontStyles
+        return min(bisect_left(self.styleHiBounds, weight), self.lastStyleIndex)
 
     def __file_bare_name(self, fPath):
         '''
@@ -560,7 +938,8 @@ class CSAllFonts:
 
         Only the last extension element is removed, so provding a file with
         multiple extensions will result in the name up to the second last
-        extension.
+        extension. The exception is the two element font extension .pcf.gz,
+        which is removed in full.
 
         Parameters
         ----------
@@ -573,56 +952,35 @@ class CSAllFonts:
         supplied name, i.e. path elements and file extension are removed.
         '''
 
-        sofn = fPath.rfind("/")
-        if sofn != -1:
-            sofn += 1
-            fName = fPath[sofn:]
-        else:
-            fName = fPath
-        eofn = fName.find(".")
-        if eofn > 0:
-            fontFile = fName[:eofn]
-        else:
-            fontFile = fName
+        fName = os.path.basename(fPath)
+        if fName.lower().endswith(".pcf.gz"):
+            return fName[:-7]
 
-        return fontFile
+        return os.path.splitext(fName)[0]
 
-    def __name_has_font_style(self, aName, needStyle):
+    def __file_style_mask(self, fPath):
         '''
-        Return True if aName has needStyle contained in it but only if needStyle
-        is one of the texts we expect to indicate a font file weight style, else
-        returns False.
+        Get the font styles that the name of a font file contains
 
         Parameters
         ----------
-            aName: string
-                Contains the name of a font file. Should usually be a result of
-                using __file_bare_name() on the filename for a font.
-            needStyle: string
-                Contains the needed font style
-        '''
-
-        # FIXME: This might be better as: if needStyle in self.fontStyle and
-        # needStyle in aName, i.e. needStyle is a known style in one step and if
-        # it is then in the supplied name as well.
+            fPath: string
+                Contains the name of a font file
 
-        # First of all does the name have any style
-        hasStyle = False
-        for aStyle in self.fontStyles:
-            # debug_message("Checking for style {} in {}".format(aStyle, aName))
-            if aName.find(aStyle) != -1:
-                hasStyle = True
-                break
+        Returns an integer with bit n set if the bare name of the file (see
+        __file_bare_name()) contains fontStyles[n]
+        '''
 
-        # if hasStyle:
-        #     debug_message("{} has a font style".format(fontFile))
-        if hasStyle:
-            if aName.find(needStyle) != -1:
-                return True
+        fontFile = self.__file_bare_name(fPath)
+        mask = 0
+        for n, aStyle in enumerate(self.fontStyles):
+            if aStyle in fontFile:
+                mask |= (1 << n)
 
-        return False
+        return mask
 
-    def __font_attr_match(self, tFont, weight, style, exactWeight):
+    def __font_attr_match(self, iFont, weight, style, exactWeight,
+                          needStyleBit):
         '''
         Given information about a font file indicate how well it matches the
         other parameters (weight, style). Handles cases where the weight might
@@ -632,22 +990,26 @@ class CSAllFonts:
 
         Parameters
         ----------
-            tFont: tuple
-                Is the same format as used for the familyToPath dictionary
-                items:
-                    tuple of path of font file, style of font and weight of font
+            iFont: integer
+                The row of the font file in the font file columns
             weight: integer
                 A desired weight to use for output
             style: string
                 Contains a standard font style name (see the fontstyles member)
             exactWeight: boolean
-                If True, requires that the font with filename tFont have a
+                If True, requires that the font file in row iFont have a
                 weight that exactly matches the weight parameter
+            needStyleBit: integer
+                The bit in the _fileStyles column for the style text a filename
+                would have for the weight parameter, see __font_weight_style().
+                It's the same for every font file so it's found once by the
+                caller.
 
         Returns an integer indicating the level of match. There are three
-        levels, see the match* member variables. matchNone indicated no match,
-        matchName indicates the font matches name but not style. matchStyle
-        indicates the font matches the required name and style.
+        levels, see the MATCH_* module constants (also the match* members).
+        MATCH_NONE indicates no match, MATCH_NAME indicates the font matches
+        name but not style. MATCH_NAME_AND_STYLE indicates the font matches the
+        required name and style.
         '''
 
         # We have to handle the weight twice, once to match it literally against
@@ -655,29 +1017,27 @@ class CSAllFonts:
         # NiceFont that have multiple filenames with font styles such as
         # ExtraBold, SemiBold, Medium, Light, ExtraLight, Thin and Bold where
         # the style is an implied weight. So try to match styles like those with
-        # the requested weight using the QFont.Weight named values
-        needStyle = self.__font_weight_style(weight)
-        if needStyle is not None:
-            # Get the filename itself
-            fontFile = self.__file_bare_name(tFont[0])
-
-            # Does the filename contain the style of the requested weight
-            foundStyle = self.__name_has_font_style(fontFile, needStyle)
-        else:
-            foundStyle = False
+        # the requested weight using the QFont.Weight named values. The styles
+        # in each filename were found when it was added to the font lists.
+        foundStyle = (self._fileStyles[iFont] & needStyleBit) != 0
 
         # Style when a raw font was created from file
-        if tFont[1] is not None:
-            if tFont[1] != style:
-                return self.matchNone
-
-        # Weight when a raw font was created from file
-        if tFont[2] > 0:
+        fontStyle = self._styles[iFont]
+        if fontStyle is not None:
+            if fontStyle != style:
+                return MATCH_NONE
+
+        # Weight when a raw font was created from file. A font without a weight
+        # can still match by the style text in it's filename
+        directWeight = False
+        fontWeight = self._weights[iFont]
+        if fontWeight > 0:
             if exactWeight:
                 # The font's default weight must exactly match the supplied
                 # weight
-                if weight != tFont[2]:
-                    return self.matchNone
+                if weight != fontWeight:
+                    return MATCH_NONE
+                directWeight = True
             else:
                 # The requested weight is considered a match for a font's
                 # default weight if requested weight is in the range containing
@@ -698,22 +1058,18 @@ class CSAllFonts:
                 #
                 # |_______w_|____x__f_|____x____|_________| NO MATCH
                 #
-                weightFit = self.standard_weight_fit(tFont[2])
-                if (weight < weightFit[0]) or (weight > weightFit[1]):
-                    directWeight = False
-                else:
-                    directWeight = True
-
-        # tFont matches supplied weight and style with font filename style
-        # text if found
-        if foundStyle:
-            return self.matchNameAndStyle
-        elif directWeight is True:
-            return self.matchNameAndStyle
-
+                weightFit = self._weightFitCache.get(fontWeight)
+                if weightFit is None:
+                    weightFit = self.standard_weight_fit(fontWeight)
+                    self._weightFitCache[fontWeight] = weightFit
+                directWeight = weightFit[0] <= weight <= weightFit[1]
+
+        # Font matches supplied weight and style with font filename style text
+        # if found
         # FIXME: Was there anything that could be called a verification of the
         # name?
-        return self.matchName
+        return MATCH_NAME_AND_STYLE if (foundStyle or directWeight) else\
+            MATCH_NAME
 
     def font_file_for_font_family_filtered(self, family, weight, style,
                                            testFileStyle=True,
@@ -747,61 +1103,101 @@ class CSAllFonts:
                 If True then in the absence of any match the first filename
                 found for the family paramter is returned
 
-        Returns a list of matching fonts on success or None on failure. The list
-        members are tuples in the same format used for the familyToPath
-        dictionary: path of font file, style of font, weight of font
+        Returns the filename of the best matching font file on success or None
+        on failure.
         '''
 
-        # self.dump_font_paths()
-        fontSet = []
+        self.__materialize_fonts()
+
+        # The same few lookups are repeated, including ones that fail. Family
+        # names in the font lists are case-folded and interned, so is the
+        # family looked up.
+        familyKey = sys.intern(family.casefold())
+        key = (familyKey, weight, style, testFileStyle, exactWeight,
+               lastResort)
+        if key in self._matchCache:
+            return self._matchCache[key]
+
+        fontFile = self.__find_font_file(familyKey, weight, style,
+                                         testFileStyle, exactWeight,
+                                         lastResort)
+        self._matchCache[key] = fontFile
+        if fontFile is not None:
+            # Saved with the font lists by save_font_lookups()
+            self._matchCacheChanged = True
 
-        # Consider any already accounted families
-        for tAccFont in self.accounted:
-            # Ignore non-matching families
-            if tAccFont[0] != family:
-                continue
+        return fontFile
 
-            # Create a new tuple of the same format as the familyToPath
-            tFont = (tAccFont[1], tAccFont[2], tAccFont[3])
-
-            # Check if it matches requested attributes, list it if yes
-            match = self.__font_attr_match(tFont, weight, style, exactWeight)
-            if testFileStyle and (match == self.matchNameAndStyle):
-                # Match family, weight, style and/or file style, put at head
-                # of results
-                fontSet.insert(0, tFont)
-            elif match >= self.matchName:
-                # Family, weight and non-file style match - append to results
-                fontSet.append(tFont)
-
-        # Consider at least a matching case in familyToPath. The presence in it
-        # has no special priority over a match in accounted.
-        if family in self.familyToPath:
-            tFont = self.familyToPath[family]
-            if len(fontSet) > 0:
-                # We already found a family/attribute match check if
-                # familyToPath also matches requested attributes, list it if yes
-                match = self.__font_attr_match(tFont, weight, style, exactWeight)
-                if testFileStyle and (match == self.matchNameAndStyle):
-                    # Match family, weight style and/or file style, put at head
-                    # of results
-                    fontSet.insert(0, tFont)
-                elif match >= self.matchName:
-                    # Family, weight and non-file style match - append to results
-                    fontSet.append(tFont)
-
-            elif lastResort:
-                # No match found, treat the first case of only the family that
-                # existed when scanning files as the best effort (if lastResort)
-                fontSet.append(tFont)
-
-        # If we found any fonts
-        if len(fontSet) > 0:
-            # Take the head tuple and return the filename from it
-            tFont = fontSet[0]
-            # debug_message("Using font file: {}".format(tFont[0]))
-            return tFont[0]
-
-        # Definately no family match. If not lastResort then no weight or style
-        # match either
+    def __find_font_file(self, familyKey, weight, style, testFileStyle,
+                         exactWeight, lastResort):
+        '''
+        Search the font file columns for a font file of a family with the
+        requested weight and style, see font_file_for_font_family_filtered()
+        for the parameters and result. The family is given case-folded as
+        familyKey.
+        '''
+
+        # self.dump_font_paths()
+        familyRows = self._familyRows.get(familyKey)
+        if familyRows is None:
+            # Definately no family match
+            return None
+
+        # An exact weight match is found by it's weight and style alone unless
+        # the family has files that might match by filename
+        if exactWeight and testFileStyle and\
+                (familyKey not in self._inexactFamilies):
+            i = self._exactIndex.get((familyKey, weight, style))
+            if i is not None:
+                # debug_message("Using font file: {}".format(self._paths[i]))
+                return self._paths[i]
+
+        # The style text expected in the filename of a font file of the
+        # requested weight is the same for every row
+        needStyleBit = 1 << self.__font_weight_style(weight)
+        attrMatch = self.__font_attr_match
+
+        # The first file found for the family is only considered after a match
+        # in the other rows of the family, see below
+        firstIndex = familyRows[0]
+        otherRows = familyRows[1:]
+        if testFileStyle:
+            # The last of the other rows to match family, weight, style and/or
+            # file style is preferred so search from the end and stop at the
+            # first found. Otherwise remember the first row matching family,
+            # weight and non-file style.
+            fallback = None
+            for i in reversed(otherRows):
+                # Check if it matches requested attributes
+                match = attrMatch(i, weight, style, exactWeight, needStyleBit)
+                if match == MATCH_NAME_AND_STYLE:
+                    fallback = i
+                    break
+                elif match >= MATCH_NAME:
+                    fallback = i
+
+            if fallback is not None:
+                # We already found a family/attribute match, the first file is
+                # preferred if it also matches family, weight style and/or
+                # file style
+                match = attrMatch(firstIndex, weight, style, exactWeight,
+                                  needStyleBit)
+                if match == MATCH_NAME_AND_STYLE:
+                    fallback = firstIndex
+                # debug_message("Using font file: {}".format(self._paths[fallback]))
+                return self._paths[fallback]
+        else:
+            # Any match of family, weight and style will do, take the first
+            for i in otherRows:
+                match = attrMatch(i, weight, style, exactWeight, needStyleBit)
+                if match >= MATCH_NAME:
+                    # debug_message("Using font file: {}".format(self._paths[i]))
+                    return self._paths[i]
+
+        if lastResort:
+            # No match found, treat the first case of only the family that
+            # existed when scanning files as the best effort (if lastResort)
+            return self._paths[firstIndex]
+
+        # If not lastResort then no weight or style match
         return None
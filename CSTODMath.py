@@ -32,6 +32,7 @@
 import time
 import datetime
 
+from functools import lru_cache
 from math import sin, cos, tan, asin, acos, atan, atan2, degrees, radians, pi
 
 from PySide6.QtCore import (QLoggingCategory, qCDebug, qCWarning)
@@ -39,6 +40,303 @@ from PySide6.QtCore import (QLoggingCategory, qCDebug, qCWarning)
 # from csdMessages import (debug_message)
 
 
+# Size of the caches of the solar position terms below. The terms are mostly
+# asked for today at a fixed time of day so few distinct inputs are in use.
+_TERM_CACHE_SIZE = 256
+
+
+# The NOAA spreadsheet terms as pure functions of their inputs, so that each is
+# computed once for the same inputs however many other terms use it. Most only
+# depend on the julian century. CSTODMath methods of the same name (without the
+# leading underscore) get the inputs for a date and time at the home location.
+# The trigonometric terms bind the math functions they use as default arguments
+# (_sin=sin etc.) so they are local names, not module global lookups. Callers
+# never pass them.
+def _ref_days(aDate):
+    # baseDate = datetime.date(1900, 1, 14)
+    baseDate = datetime.date(1899, 12, 30)
+    deltaDate = abs(aDate - baseDate)
+    return deltaDate.days
+# _ref_days
+
+
+def _frac_of_local_day(aTime):
+    # Get second of the day from the time
+    fDay = aTime.hour * 3600.0
+    fDay += aTime.minute * 60.0
+    fDay += aTime.second * 1.0
+
+    # Fraction of day is the second of the day divided by seconds in a day
+    fDay /= 86400.0
+
+    return fDay
+# _frac_of_local_day
+
+
+def _julian_day(aDate, aTime, homeTZ):
+    jDay = _ref_days(aDate) + 2415018.5 +\
+            _frac_of_local_day(aTime) - homeTZ / 24.0
+    # =D2+2415018.5+E2-$B$5/24
+
+    return jDay
+# _julian_day
+
+
+@lru_cache(maxsize=_TERM_CACHE_SIZE)
+def _julian_century(aDate, aTime, homeTZ):
+    jCent = _julian_day(aDate, aTime, homeTZ)
+    jCent -= 2451545.0
+    jCent /= 36525.0
+    # =(F2-2451545)/36525
+
+    return jCent
+# _julian_century
+
+
+@lru_cache(maxsize=_TERM_CACHE_SIZE)
+def _sun_geom_mean_long(jCent):
+    mLong = (280.46646 + jCent * (36000.76983 + jCent * 0.0003032)) % 360
+    # =MOD(280.46646+G2*(36000.76983+G2*0.0003032),360)
+
+    return mLong
+# _sun_geom_mean_long
+
+
+@lru_cache(maxsize=_TERM_CACHE_SIZE)
+def _sun_geom_mean_anom(jCent):
+    mAnom = 357.52911 + jCent * (35999.05029 - 0.0001537 * jCent)
+    # =357.52911+G2*(35999.05029-0.0001537*G2)
+
+    return mAnom
+# _sun_geom_mean_anom
+
+
+@lru_cache(maxsize=_TERM_CACHE_SIZE)
+def _sun_eq_of_ctr(jCent, _sin=sin, _rad=radians):
+    mAnomRad = _rad(_sun_geom_mean_anom(jCent))
+    sEqC = _sin(mAnomRad)
+    sEqC *= (1.914602 - jCent * (0.004817 + 0.000014 * jCent))
+    sEqC += _sin(2 * mAnomRad) * (0.019993 - 0.000101 * jCent)
+    sEqC += _sin(3 * mAnomRad) * 0.000289
+    # =SIN(RADIANS(J2))*(1.914602-G2*(0.004817+0.000014*G2))+SIN(RADIANS(2*J2))*(0.019993-0.000101*G2)+SIN(RADIANS(3*J2))*0.000289
+
+    return sEqC
+# _sun_eq_of_ctr
+
+
+def _sun_true_long(jCent):
+    tLong = _sun_geom_mean_long(jCent) + _sun_eq_of_ctr(jCent)
+    # =I2+L2
+
+    return tLong
+# _sun_true_long
+
+
+def _sun_true_anom(jCent):
+    tAnom = _sun_geom_mean_anom(jCent) + _sun_eq_of_ctr(jCent)
+    # =J2+L2
+
+    return tAnom
+# _sun_true_anom
+
+
+def _sun_rad_vector(jCent):
+    oEccent = _earth_orbit_eccent(jCent)
+    tAnom = _sun_true_anom(jCent)
+    rVec = (1.000001018 * (1 - oEccent * oEccent))
+    rVec /= (1 + oEccent * cos(radians(tAnom)))
+    # =(1.000001018*(1-K2*K2))/(1+K2*COS(RADIANS(N2)))
+
+    return rVec
+# _sun_rad_vector
+
+
+@lru_cache(maxsize=_TERM_CACHE_SIZE)
+def _sun_app_long_degrees(jCent):
+    tLong = _sun_true_long(jCent)
+    aLong = tLong - 0.00569 - 0.00478 *\
+        sin(radians(125.04 - 1934.136 * jCent))
+    # =M2-0.00569-0.00478*SIN(RADIANS(125.04-1934.136*G2))
+
+    return aLong
+# _sun_app_long_degrees
+
+
+# The sun's apparent longitude and corrected obliquity and the declination
+# computed from them, all in radians. Used together by the declination, right
+# ascension, variance and sunrise hour angle terms.
+# Returns a tuple of declination, corrected obliquity and apparent longitude
+@lru_cache(maxsize=_TERM_CACHE_SIZE)
+def _solar_angles(jCent, _asin=asin, _sin=sin, _rad=radians):
+    aLongRad = _rad(_sun_app_long_degrees(jCent))
+    oCorrRad = _rad(_obliq_corr_degrees(jCent))
+    sDecRad = _asin(_sin(oCorrRad) * _sin(aLongRad))
+
+    return (sDecRad, oCorrRad, aLongRad)
+# _solar_angles
+
+
+def _sun_right_ascension(jCent):
+    sDecRad, oCorr, aLong = _solar_angles(jCent)
+
+    x = cos(aLong)
+    y = cos(oCorr) * sin(aLong)
+
+    rAscRad = atan2(y, x)
+    rAscDeg = degrees(rAscRad)
+
+    # =DEGREES(ATAN2(COS(RADIANS(P2)),COS(RADIANS(R2))*SIN(RADIANS(P2))))
+    # For atan2:
+    # x is COS(RADIANS(P2))
+    # y is COS(RADIANS(R2))*SIN(RADIANS(P2))
+    # In python math function is atan2(y, x)
+    # In LibreOffice function is atan2(x, y)
+
+    return rAscDeg
+# _sun_right_ascension
+
+
+def _sun_declination(jCent):
+    sDec = degrees(_solar_angles(jCent)[0])
+    # =DEGREES(ASIN(SIN(RADIANS(R2))*SIN(RADIANS(P2))))
+
+    return sDec
+# _sun_declination
+
+
+def _sun_variance(jCent):
+    tanHalfOCorr = tan(_solar_angles(jCent)[1] / 2)
+    sVar = tanHalfOCorr * tanHalfOCorr
+    # =TAN(RADIANS(R2/2))*TAN(RADIANS(R2/2))
+
+    return sVar
+# _sun_variance
+
+
+# Cosine of the sun's zenith angle at sunrise/sunset, allowing for refraction
+_COS_SUNRISE_ZENITH = cos(radians(90.833))
+
+
+# The home latitude is given by it's cosine and tangent, they only change when
+# the latitude is set
+@lru_cache(maxsize=_TERM_CACHE_SIZE)
+def _HA_sunrise(jCent, cosHomeLat, tanHomeLat, _acos=acos, _cos=cos,
+                _tan=tan, _deg=degrees):
+    sDecRad = _solar_angles(jCent)[0]
+    haRiseIn = _acos(_COS_SUNRISE_ZENITH / (cosHomeLat * _cos(sDecRad)) -
+                     tanHomeLat * _tan(sDecRad))
+    haRise = _deg(haRiseIn)
+    # =DEGREES(ACOS(COS(RADIANS(90.833))/(COS(RADIANS($B$3))*COS(RADIANS(T2)))-TAN(RADIANS($B$3))*TAN(RADIANS(T2))))
+
+    return haRise
+# _HA_sunrise
+
+
+# The mean obliquity polynomial's coefficients with the arc minute and arc
+# second conversions folded in
+_MEAN_OBLIQ_C0 = 23 + 26 / 60 + 21.448 / 3600
+_MEAN_OBLIQ_C1 = 46.815 / 3600
+_MEAN_OBLIQ_C2 = 0.00059 / 3600
+_MEAN_OBLIQ_C3 = 0.001813 / 3600
+
+
+def _mean_obliq_ecliptic(jCent):
+    mObEcclip = _MEAN_OBLIQ_C0 - jCent * (_MEAN_OBLIQ_C1 + jCent *
+                                          (_MEAN_OBLIQ_C2 -
+                                           jCent * _MEAN_OBLIQ_C3))
+    # =23+(26+((21.448-G2*(46.815+G2*(0.00059-G2*0.001813))))/60)/60
+
+    return mObEcclip
+# _mean_obliq_ecliptic
+
+
+@lru_cache(maxsize=_TERM_CACHE_SIZE)
+def _obliq_corr_degrees(jCent):
+    mObEcclip = _mean_obliq_ecliptic(jCent)
+    oCorr = mObEcclip + 0.00256 * cos(radians(125.04 - 1934.136 * jCent))
+    # =Q2+0.00256*COS(RADIANS(125.04-1934.136*G2))
+
+    return oCorr
+# _obliq_corr_degrees
+
+
+def _earth_orbit_eccent(jCent):
+    oEccent = 0.016708634 - jCent * (0.000042037 + 0.0000001267*jCent)
+    # =0.016708634-G2*(0.000042037+0.0000001267*G2)
+
+    return oEccent
+# _earth_orbit_eccent
+
+
+# Minutes of time per radian of the earth's rotation, 4 minutes per degree
+_MINUTES_PER_RADIAN = 4 * 180 / pi
+
+
+# Eq of Time (minutes)
+@lru_cache(maxsize=_TERM_CACHE_SIZE)
+def _eq_of_time(jCent, _sin=sin, _cos=cos, _rad=radians):
+    mLongRad = _rad(_sun_geom_mean_long(jCent))
+    mAnomRad = _rad(_sun_geom_mean_anom(jCent))
+    oEccent = _earth_orbit_eccent(jCent)
+    sVary = _sun_variance(jCent)
+    sinAnom = _sin(mAnomRad)
+    eTime = _MINUTES_PER_RADIAN * (sVary * _sin(2 * mLongRad) -
+                                   2 * oEccent * sinAnom +
+                                   4 * oEccent * sVary * sinAnom *
+                                   _cos(2 * mLongRad) -
+                                   0.5 * sVary * sVary * _sin(4 * mLongRad) -
+                                   1.25 * oEccent * oEccent *
+                                   _sin(2 * mAnomRad))
+    # =4*DEGREES(U2*SIN(2*RADIANS(I2))-2*K2*SIN(RADIANS(J2))+4*K2*U2*SIN(RADIANS(J2))*COS(2*RADIANS(I2))-0.5*U2*U2*SIN(4*RADIANS(I2))-1.25*K2*K2*SIN(2*RADIANS(J2)))
+
+    return eTime
+# _eq_of_time
+
+
+@lru_cache(maxsize=_TERM_CACHE_SIZE)
+def _solar_noon(jCent, homeLong, homeTZ):
+    eTime = _eq_of_time(jCent)
+    sNoon = (720 - 4 * homeLong - eTime + homeTZ * 60) / 1440
+    # =(720-4*$B$4-V2+$B$5*60)/1440
+
+    return sNoon
+# _solar_noon
+
+
+# Whole hours to add to the system clock for it to read in the home timezone.
+# The system UTC offset (seconds) and the home timezone (hours) rarely change.
+@lru_cache(maxsize=16)
+def _tz_hour_correction(sysGMTOff, homeTZ):
+    return int(sysGMTOff / 3600.0 - homeTZ)
+# _tz_hour_correction
+
+
+# The results used by CSTODMath for sunrise and sunset in one call
+# Returns a tuple of local sunrise and local sunset (fractions of a 24 hour day)
+@lru_cache(maxsize=_TERM_CACHE_SIZE)
+def _solar_core(jCent, cosHomeLat, tanHomeLat, homeLong, homeTZ):
+    # The hour angle is degrees(acos()), never negative. Solar noon is only
+    # negative for a timezone far west of the longitude, wrap it into the day
+    hRise = _HA_sunrise(jCent, cosHomeLat, tanHomeLat)
+    sNoon = _solar_noon(jCent, homeLong, homeTZ)
+    if sNoon < 0:
+        sNoon += 1
+    lRise = sNoon - hRise * 4 / 1440
+    # =X2-W2*4/1440
+    lSet = sNoon + hRise * 4 / 1440
+    # =X2+W2*4/1440
+
+    return (lRise, lSet)
+# _solar_core
+
+
+# Time of day today's sunrise and sunset are computed for, 00:06 local time
+_DAY_REF_TIME = datetime.time(0, 6, 0)
+
+# Seconds a local time struct is reused for before the clock is read again
+_NOW_STRUCT_AGE = 0.5
+
+
 # CSTODMath - Worldwide Time-Of-Day information calculator that only requires
 # that a latitude/longitude and timezone offset be provided for full operation.
 # Use to calculate things like sunrise/sunset, day/night duration, whether it's
@@ -46,80 +344,144 @@ from PySide6.QtCore import (QLoggingCategory, qCDebug, qCWarning)
 # decimal fraction of day/night or hours minutes for time and seconds and
 # decimal degrees or degrees, minutes & seconds for positions.
 class CSTODMath:
+    # Every instance attribute, set in __init__. No per-instance __dict__.
+    __slots__ = ('HomeLat', 'HomeLong', 'Today', 'systemTime', 'HomeTZ',
+                 'CorrectForSysTZ', '_dayKey', '_dayRiseSet', '_dayFraction',
+                 '_nightFraction', '_dayTimes', '_dayDeltas', '_homeLatRad',
+                 '_cosHomeLat', '_tanHomeLat', '_nowTime', '_nowStruct')
+
     # Global state
     doDBug = False
     doTest = False
 
-    HomeLat = 0.0
-    HomeLong = 0.0
-    # HomeLat = 29.976634
-    # HomeLong = -101.766673
-    # HomeLat = 55.8
-    # HomeLong = -4.5
-    Today = datetime.date.today()
-    systemTime = time.localtime()
-    HomeTZ = ((1.0 * systemTime.tm_gmtoff) / 3600.0)
-    # HomeTZ = 0.0
-
-    CorrectForSysTZ = False
-
     logCategory = QLoggingCategory("csdevs.math.TOD")
 
     def __init__(self):
-        pass
+        # The last local time read and when, see _now_struct()
+        self._nowTime = None
+        self._nowStruct = None
+
+        # Home location and timezone, per instance
+        self.HomeLat = 0.0
+        self.HomeLong = 0.0
+        # self.HomeLat = 29.976634
+        # self.HomeLong = -101.766673
+        # self.HomeLat = 55.8
+        # self.HomeLong = -4.5
+        self.Today = datetime.date.today()
+        self.systemTime = self._now_struct()
+        self.HomeTZ = ((1.0 * self.systemTime.tm_gmtoff) / 3600.0)
+        # self.HomeTZ = 0.0
+
+        self.CorrectForSysTZ = False
+
+        # Today's sunrise and sunset fractions of day, what follows from them
+        # and the date, location and timezone they are for, see _ensure_today()
+        self._dayKey = None
+        self._dayRiseSet = None
+        self._dayFraction = None
+        self._nightFraction = None
+        self._dayTimes = None
+        self._dayDeltas = None
+
+        # Home latitude in radians with it's cosine and tangent
+        self._set_home_lat_terms()
+
+    # Keep the home latitude terms used in the sunrise hour angle up to date
+    # with the home latitude
+    def _set_home_lat_terms(self):
+        self._homeLatRad = radians(self.HomeLat)
+        self._cosHomeLat = cos(self._homeLatRad)
+        self._tanHomeLat = tan(self._homeLatRad)
+
+    # Compute today's sunrise and sunset at the home location with the day and
+    # night fractions and the sunrise and sunset times and timedeltas, only
+    # when the date, location or timezone have changed
+    def _ensure_today(self):
+        Today = datetime.date.today()
+        dayKey = (Today, self.HomeLat, self.HomeLong, self.HomeTZ)
+        if dayKey != self._dayKey:
+            r, s = self._rise_set_pair(Today, _DAY_REF_TIME)
+            self._dayRiseSet = (r, s)
+            self._dayFraction = s - r
+            self._nightFraction = 1.0 - self._dayFraction
+
+            sRise = self.time_from_day_fraction(r)
+            sSet = self.time_from_day_fraction(s)
+            self._dayTimes = (sRise, sSet)
+            self._dayDeltas = (datetime.timedelta(hours=sRise.hour,
+                                                  minutes=sRise.minute,
+                                                  seconds=sRise.second),
+                               datetime.timedelta(hours=sSet.hour,
+                                                  minutes=sSet.minute,
+                                                  seconds=sSet.second))
+            self._dayKey = dayKey
+
+    # Get today's sunrise and sunset, computed once per day at the home location
+    # Returns a tuple of floats, sunrise and sunset as fractions of a 24 hour day
+    def _today_rise_set(self):
+        self._ensure_today()
+
+        return self._dayRiseSet
+
+    # Get the local time, reusing the last one read if it is less than half a
+    # second old so that the many checks of one GUI update share a clock read
+    # Returns a time.struct_time
+    def _now_struct(self):
+        t = time.time()
+        if self._nowTime is None or abs(t - self._nowTime) >= _NOW_STRUCT_AGE:
+            self._nowStruct = time.localtime(t)
+            self._nowTime = t
+
+        return self._nowStruct
 
     # Get the current time
     # Returns a daytime type (h:m:s)
     def get_time_now(self):
-        systemTime = time.localtime()
+        systemTime = self._now_struct()
 
         return datetime.time(systemTime[3], systemTime[4], systemTime[5])
 
-    # Get the current time and correct from system timezone to a saved timezone
-    # Returns a daytime type (h:m:s)
-    def get_time_now_with_correction(self):
-        timeNow = self.get_time_now()
-        correctHour = timeNow.hour
+    # Get the current time, corrected from system timezone to a saved timezone
+    # if needed, as seconds since midnight
+    # Returns an integer in the range zero to 86399 inclusive
+    def _now_seconds(self):
+        systemTime = self._now_struct()
+        correctHour = systemTime.tm_hour
         if self.CorrectForSysTZ is True:
-            systemTime = time.localtime()
-            sysTZ = 1.0 * systemTime.tm_gmtoff
-            sysTZ /= 3600.0
             usingTZ = self.get_home_TZ()
-
-            correction = int(sysTZ - usingTZ)
-            qCDebug(self.logCategory,
-                    "TZ: Clock {}, Home {}".format(sysTZ, usingTZ))
-            qCDebug(self.logCategory,
-                    "Time {} correction {}".format(correctHour, correction))
-            # debug_message("TZ: Clock {}, Home {}".format(sysTZ, usingTZ))
+            correction = _tz_hour_correction(systemTime.tm_gmtoff, usingTZ)
+            # Only format the messages when they will be logged
+            if self.logCategory.isDebugEnabled():
+                qCDebug(self.logCategory,
+                        "TZ: Clock {}, Home {}".format(
+                            systemTime.tm_gmtoff / 3600.0, usingTZ))
+                qCDebug(self.logCategory,
+                        "Time {} correction {}".format(correctHour,
+                                                       correction))
+            # debug_message("TZ: Clock {}, Home {}".format(
+            #     systemTime.tm_gmtoff / 3600.0, usingTZ))
             # debug_message("Time {} correction {}".format(correctHour, correction))
 
-            correctHour += correction
-            while correctHour < 0:
-                correctHour += 24
-            while correctHour > 23:
-                correctHour -= 24
-
-        # debug_message("CT: {}:{}:{}".format(correctHour, timeNow.minute,
-        #                                    timeNow.second))
-
-        correctedTime = datetime.time(correctHour,
-                                      timeNow.minute,
-                                      timeNow.second)
-        # msg = "UsingTZ: {}, SysTZ: {}, ".format(usingTZ, sysTZ)
-        # msg += "Correction: {}, ".format(correction)
-        # msg += "Hour: {} => {}".format(timeNow.hour, correctHour)
-        # debug_message(msg)
+            correctHour = (correctHour + correction) % 24
+
+        # debug_message("CT: {}:{}:{}".format(correctHour, systemTime.tm_min,
+        #                                    systemTime.tm_sec))
+
+        return correctHour * 3600 + systemTime.tm_min * 60 + systemTime.tm_sec
+
+    # Get the current time and correct from system timezone to a saved timezone
+    # Returns a daytime type (h:m:s)
+    def get_time_now_with_correction(self):
+        correctHour, y = divmod(self._now_seconds(), 3600)
+        correctMinute, correctSecond = divmod(y, 60)
 
-        return correctedTime
+        return datetime.time(correctHour, correctMinute, correctSecond)
 
     # Get the current time as a fraction of a 24 hour day
     # Returns a float in the range zero to one inclusive
     def get_time_now_fraction_of_day(self):
-        timeNow = self.get_time_now_with_correction()
-        y = timeNow.hour * 3600.0
-        y += timeNow.minute * 60.0
-        y += timeNow.second
+        y = self._now_seconds()
 
         # debug_message("Seconds used in day: {}".format(y))
 
@@ -128,88 +490,71 @@ class CSTODMath:
     # Returns the fraction of the day that is daytime
     # Returns a float with value greater than zero and less than one
     def daytime_fraction_of_day(self):
-        Today = datetime.date.today()
-        aTime = datetime.time(0, 6, 0)
+        self._ensure_today()
 
-        r = self.local_sunrise(Today, aTime)
-        s = self.local_sunset(Today, aTime)
-
-        return (s - r)
+        return self._dayFraction
 
     # Get the fraction of the day that is nighttime
     # Returns a float with value greater than zero and less than one
     # NB: Returns the amount of night during this day, i.e. before today's
     # sunrise plus after today's sunset. Not a continuous time of night
     def nighttime_fraction_of_day(self):
-        return (1.0 - self.daytime_fraction_of_day())
+        self._ensure_today()
+
+        return self._nightFraction
 
     # Get today's sunrise time as a fraction of a 24 hour day
     # Returns a float in the range zero to one inclusive
     def get_sunrise_fraction_of_day(self):
-        Today = datetime.date.today()
-        aTime = datetime.time(0, 6, 0)
-
-        # debug_message("Local sunrise: {}".format(self.local_sunrise(Today, aTime)))
+        # debug_message("Local sunrise: {}".format(self._today_rise_set()[0]))
 
-        return self.local_sunrise(Today, aTime)
+        return self._today_rise_set()[0]
 
     # Get today's sunrise time
     # Returns a datetime object (h:m:s)
     def get_sunrise_time(self):
-        x = self.get_sunrise_fraction_of_day()
+        self._ensure_today()
 
-        # debug_message("Sunrise fraction: {}".format(x))
+        # debug_message("Sunrise fraction: {}".format(self._dayRiseSet[0]))
 
-        return self.time_from_day_fraction(x)
+        return self._dayTimes[0]
 
     # Get today's sunrise time
     # Returns a timedelta object
     def get_sunrise_delta(self):
-        sRise = self.get_sunrise_time()
+        self._ensure_today()
 
-        return datetime.timedelta(hours=sRise.hour,
-                                  minutes=sRise.minute,
-                                  seconds=sRise.second)
+        return self._dayDeltas[0]
 
     # Get today's sunset time as a fraction of a 24 hour day
     # Returns a float in the range zero to one inclusive
     def get_sunset_fraction_of_day(self):
-        Today = datetime.date.today()
-        aTime = datetime.time(0, 6, 0)
-
-        # debug_message("Sunset fraction has local sunset: {}".format(self.local_sunset(Today, aTime)))
+        # debug_message("Sunset fraction has local sunset: {}".format(self._today_rise_set()[1]))
 
-        return self.local_sunset(Today, aTime)
+        return self._today_rise_set()[1]
 
     # Get today's sunset time
     # Returns a datetime object (h:m:s)
     def get_sunset_time(self):
-        x = self.get_sunset_fraction_of_day()
+        self._ensure_today()
 
-        # debug_message("Sunset fraction: {}".format(x))
+        # debug_message("Sunset fraction: {}".format(self._dayRiseSet[1]))
 
-        return self.time_from_day_fraction(x)
+        return self._dayTimes[1]
 
     # Get today's sunset time
     # Returns a timedelta object
     def get_sunset_delta(self):
-        sSet = self.get_sunset_time()
+        self._ensure_today()
 
-        return datetime.timedelta(hours=sSet.hour,
-                                  minutes=sSet.minute,
-                                  seconds=sSet.second)
+        return self._dayDeltas[1]
 
     # Get the current time and correct from system timezone to a saved timezone
     # Returns a timedelta object
     def get_time_now_delta_with_correction(self):
-        TimeNow = self.get_time_now_with_correction()
+        # debug_message("dT: {}".format(self.get_time_now_with_correction()))
 
-        # debug_message("dT: {}:{}:{}".format(TimeNow.hour, TimeNow.minute,
-        #                                     TimeNow.second))
-
-        return datetime.timedelta(hours=TimeNow.hour,
-                                  minutes=TimeNow.minute,
-                                  seconds=TimeNow.second)
+        return datetime.timedelta(seconds=self._now_seconds())
 
     # Returns true if it's after sunset but before midnight
     # Returns a bool
@@ -246,9 +591,9 @@ class CSTODMath:
     # time Automatically chooses daytime or nighttime
     # Returns a float in the range zero to one
     def get_time_now_fraction_of_light_period(self):
-        srDelta = self.get_sunrise_fraction_of_day()
-        ssDelta = self.get_sunset_fraction_of_day()
+        srDelta, ssDelta = self._today_rise_set()
         nowDelta = self.get_time_now_fraction_of_day()
+        dayFraction = ssDelta - srDelta
         # debug_message("Time deltas getting fraction of light period:")
         # debug_message("\\_ Sunrise: {}".format(srDelta))
         # debug_message("\\_  Sunset: {}".format(ssDelta))
@@ -257,11 +602,11 @@ class CSTODMath:
             # debug_message("Compute fraction of DAY")
             # Subtract sunrise from now, all as a fraction of ratio of daytime
             elapsedFraction = nowDelta - srDelta
-            elapsedFraction /= self.daytime_fraction_of_day()
+            elapsedFraction /= dayFraction
         else:
             # debug_message("Compute fraction of NIGHT")
             # Night crosses midnight, take care
-            if self.its_after_sunset_today():
+            if nowDelta > ssDelta:
                 # debug_message("\\_ MORNING")
                 # Evening, subtract sunset
                 elapsedFraction = nowDelta - ssDelta
@@ -271,7 +616,7 @@ class CSTODMath:
                 elapsedFraction = 1.0 - ssDelta + nowDelta
 
             # As a fraction of nighttime
-            elapsedFraction /= self.nighttime_fraction_of_day()
+            elapsedFraction /= (1.0 - dayFraction)
 
         # msg = "time now as a fraction of "
         # msg += "current light period: {}".format(elapsedFraction)
@@ -280,22 +625,11 @@ class CSTODMath:
         return elapsedFraction
 
     def ref_days(self, aDate):
-        # baseDate = datetime.date(1900, 1, 14)
-        baseDate = datetime.date(1899, 12, 30)
-        deltaDate = abs(aDate - baseDate)
-        return deltaDate.days
+        return _ref_days(aDate)
     # ref_days
 
     def frac_of_local_day(self, aTime):
-        # Get second of the day from the time
-        fDay = aTime.hour * 3600.0
-        fDay += aTime.minute * 60.0
-        fDay += aTime.second * 1.0
-
-        # Fraction of day is the second of the day divided by seconds in a day
-        fDay /= 86400.0
-
-        return fDay
+        return _frac_of_local_day(aTime)
     # frac_of_local_day
 
     def time_from_day_fraction(self, fracOfDay):
@@ -317,211 +651,108 @@ class CSTODMath:
     # time_from_day_fraction
 
     def julian_day(self, aDate, aTime=datetime.time(0, 0, 0)):
-        jDay = self.ref_days(aDate) + 2415018.5 +\
-                self.frac_of_local_day(aTime) - self.HomeTZ / 24.0
-        # =D2+2415018.5+E2-$B$5/24
-
-        return jDay
+        return _julian_day(aDate, aTime, self.HomeTZ)
     # julian_day
 
     def julian_century(self, aDate, aTime=datetime.time(0, 0, 0)):
-        jCent = self.julian_day(aDate, aTime)
-        jCent -= 2451545.0
-        jCent /= 36525.0
-        # =(F2-2451545)/36525
-
-        return jCent
+        return _julian_century(aDate, aTime, self.HomeTZ)
     # julian_century
 
     def sun_geom_mean_long(self, aDate, aTime=datetime.time(0, 0, 0)):
-        jCent = self.julian_century(aDate, aTime)
-        mLong = (280.46646 + jCent * (36000.76983 + jCent * 0.0003032)) % 360
-        # =MOD(280.46646+G2*(36000.76983+G2*0.0003032),360)
-
-        return mLong
+        return _sun_geom_mean_long(self.julian_century(aDate, aTime))
     # sun_geom_mean_long
 
     def sun_geom_mean_anom(self, aDate, aTime=datetime.time(0, 0, 0)):
-        jCent = self.julian_century(aDate, aTime)
-        mAnom = 357.52911 + jCent * (35999.05029 - 0.0001537 * jCent)
-        # =357.52911+G2*(35999.05029-0.0001537*G2)
-
-        return mAnom
+        return _sun_geom_mean_anom(self.julian_century(aDate, aTime))
     # sun_geom_mean_anom
 
     def sun_eq_of_ctr(self, aDate, aTime=datetime.time(0, 0, 0)):
-        jCent = self.julian_century(aDate, aTime)
-        mAnom = self.sun_geom_mean_anom(aDate, aTime)
-        sEqC = sin(radians(mAnom))
-        sEqC *= (1.914602 - jCent * (0.004817 + 0.000014 * jCent))
-        sEqC += sin(radians(2 * mAnom)) * (0.019993 - 0.000101 * jCent)
-        sEqC += sin(radians(3 * mAnom)) * 0.000289
-        # =SIN(RADIANS(J2))*(1.914602-G2*(0.004817+0.000014*G2))+SIN(RADIANS(2*J2))*(0.019993-0.000101*G2)+SIN(RADIANS(3*J2))*0.000289
-
-        return sEqC
+        return _sun_eq_of_ctr(self.julian_century(aDate, aTime))
     # sun_eq_of_ctr
 
     def sun_true_long(self, aDate, aTime=datetime.time(0, 0, 0)):
-        tLong = self.sun_geom_mean_long(aDate, aTime) +\
-                self.sun_eq_of_ctr(aDate, aTime)
-        # =I2+L2
-
-        return tLong
+        return _sun_true_long(self.julian_century(aDate, aTime))
     # sun_true_long
 
     def sun_true_anom(self, aDate, aTime=datetime.time(0, 0, 0)):
-        tAnom = self.sun_geom_mean_anom(aDate, aTime) +\
-                self.sun_eq_of_ctr(aDate, aTime)
-        # =J2+L2
-
-        return tAnom
+        return _sun_true_anom(self.julian_century(aDate, aTime))
     # sun_true_anom
 
     def sun_rad_vector(self, aDate, aTime=datetime.time(0, 0, 0)):
-        oEccent = self.earth_orbit_eccent(aDate, aTime)
-        tAnom = self.sun_true_anom(aDate, aTime)
-        rVec = (1.000001018 * (1 - oEccent * oEccent))
-        rVec /= (1 + oEccent * cos(radians(tAnom)))
-        # =(1.000001018*(1-K2*K2))/(1+K2*COS(RADIANS(N2)))
-
-        return rVec
+        return _sun_rad_vector(self.julian_century(aDate, aTime))
     # sun_rad_vector
 
     def sun_app_long_degrees(self, aDate, aTime=datetime.time(0, 0, 0)):
-        jCent = self.julian_century(aDate, aTime)
-        tLong = self.sun_true_long(aDate, aTime)
-        aLong = tLong - 0.00569 - 0.00478 *\
-            sin(radians(125.04 - 1934.136 * jCent))
-        # =M2-0.00569-0.00478*SIN(RADIANS(125.04-1934.136*G2))
-
-        return aLong
+        return _sun_app_long_degrees(self.julian_century(aDate, aTime))
     # sun_app_long_degrees
 
     def sun_right_ascension(self, aDate, aTime=datetime.time(0, 0, 0)):
-        aLong = radians(self.sun_app_long_degrees(aDate, aTime))
-        oCorr = radians(self.obliq_corr_degrees(aDate, aTime))
-
-        x = cos(aLong)
-        y = cos(oCorr) * sin(aLong)
-
-        rAscRad = atan2(y, x)
-        rAscDeg = degrees(rAscRad)
-
-        # aLong = 84.61
-        # oCorr = 23.44
-        # rAsc = degrees(atan2(cos(radians(aLong)),
-        #                cos(radians(oCorr)) * sin(radians(aLong))))
-
-        # =DEGREES(ATAN2(COS(RADIANS(P2)),COS(RADIANS(R2))*SIN(RADIANS(P2))))
-        # For atan2:
-        # x is COS(RADIANS(P2))
-        # y is COS(RADIANS(R2))*SIN(RADIANS(P2))
-        # In python math function is atan2(y, x)
-        # In LibreOffice function is atan2(x, y)
-
-        return rAscDeg
+        return _sun_right_ascension(self.julian_century(aDate, aTime))
     # sun_right_ascension
 
     def sun_declination(self, aDate, aTime=datetime.time(0, 0, 0)):
-        aLong = self.sun_app_long_degrees(aDate, aTime)
-        oCorr = self.obliq_corr_degrees(aDate, aTime)
-        sDec = degrees(asin(sin(radians(oCorr)) * sin(radians(aLong))))
-        # =DEGREES(ASIN(SIN(RADIANS(R2))*SIN(RADIANS(P2))))
-
-        return sDec
+        return _sun_declination(self.julian_century(aDate, aTime))
     # sun_declination
 
     def sun_variance(self, aDate, aTime=datetime.time(0, 0, 0)):
-        oCorr = self.obliq_corr_degrees(aDate, aTime)
-        sVar = tan(radians(oCorr / 2)) * tan(radians(oCorr / 2))
-        # =TAN(RADIANS(R2/2))*TAN(RADIANS(R2/2))
-
-        return sVar
+        return _sun_variance(self.julian_century(aDate, aTime))
     # sun_variance
 
     def HA_sunrise(self, aDate, aTime=datetime.time(0, 0, 0)):
-        sDecRad = radians(self.sun_declination(aDate, aTime))
-        homeLatRad = radians(self.HomeLat)
-        haRiseIn = acos(cos(radians(90.833)) / (cos(homeLatRad) *
-                        cos(sDecRad)) - tan(homeLatRad) *
-                        tan(sDecRad))
-        haRise = degrees(haRiseIn)
-        # haRise = degrees(acos(cos(radians(90.833)) / (cos(radians(self.HomeLat)) * cos(radians(self.sun_declination(aDate, aTime)))) - tan(radians(self.HomeLat)) * tan(radians(self.sun_declination(aDate, aTime)))))
-        # =DEGREES(ACOS(COS(RADIANS(90.833))/(COS(RADIANS($B$3))*COS(RADIANS(T2)))-TAN(RADIANS($B$3))*TAN(RADIANS(T2))))
-
-        return haRise
+        return _HA_sunrise(self.julian_century(aDate, aTime),
+                           self._cosHomeLat, self._tanHomeLat)
     # HA_sunrise
 
     def mean_obliq_ecliptic(self, aDate, aTime=datetime.time(0, 0, 0)):
-        jCent = self.julian_century(aDate, aTime)
-        mObEcclip = 23 + (26 + ((21.448 - jCent * (46.815 + jCent * (0.00059 -
-                                jCent * 0.001813)))) / 60) / 60
-        # =23+(26+((21.448-G2*(46.815+G2*(0.00059-G2*0.001813))))/60)/60
-
-        return mObEcclip
+        return _mean_obliq_ecliptic(self.julian_century(aDate, aTime))
     # mean_obliq_ecliptic
 
     def obliq_corr_degrees(self, aDate, aTime=datetime.time(0, 0, 0)):
-        jCent = self.julian_century(aDate, aTime)
-        mObEcclip = self.mean_obliq_ecliptic(aDate, aTime)
-        oCorr = mObEcclip + 0.00256 * cos(radians(125.04 - 1934.136 * jCent))
-        # =Q2+0.00256*COS(RADIANS(125.04-1934.136*G2))
-
-        return oCorr
+        return _obliq_corr_degrees(self.julian_century(aDate, aTime))
     # obliq_corr_degrees
 
     def earth_orbit_eccent(self, aDate, aTime=datetime.time(0, 0, 0)):
-        jCent = self.julian_century(aDate, aTime)
-        oEccent = 0.016708634 - jCent * (0.000042037 + 0.0000001267*jCent)
-        # =0.016708634-G2*(0.000042037+0.0000001267*G2)
-
-        return oEccent
+        return _earth_orbit_eccent(self.julian_century(aDate, aTime))
     # earth_orbit_eccent
 
     # Eq of Time (minutes)
     def eq_of_time(self, aDate, aTime=datetime.time(0, 0, 0)):
-        mLong = self.sun_geom_mean_long(aDate, aTime)
-        mAnom = self.sun_geom_mean_anom(aDate, aTime)
-        oEccent = self.earth_orbit_eccent(aDate, aTime)
-        sVary = self.sun_variance(aDate, aTime)
-        # eTime = -1
-        eTime = 4 * degrees(sVary * sin(2 * radians(mLong)) - 2 * oEccent *
-                            sin(radians(mAnom)) + 4 * oEccent * sVary *
-                            sin(radians(mAnom)) * cos(2 * radians(mLong)) -
-                            0.5 * sVary * sVary * sin(4 * radians(mLong)) -
-                            1.25 * oEccent * oEccent * sin(2 * radians(mAnom)))
-        # =4*DEGREES(U2*SIN(2*RADIANS(I2))-2*K2*SIN(RADIANS(J2))+4*K2*U2*SIN(RADIANS(J2))*COS(2*RADIANS(I2))-0.5*U2*U2*SIN(4*RADIANS(I2))-1.25*K2*K2*SIN(2*RADIANS(J2)))
-
-        return eTime
+        return _eq_of_time(self.julian_century(aDate, aTime))
     # eq_of_time
 
     def solar_noon(self, aDate, aTime=datetime.time(0, 0, 0)):
-        # rDays = ref_days(aDate)
-        eTime = self.eq_of_time(aDate, aTime)
-        sNoon = (720 - 4 * self.HomeLong - eTime + self.HomeTZ * 60) / 1440
-        # =(720-4*$B$4-V2+$B$5*60)/1440
-
-        return sNoon
+        return _solar_noon(self.julian_century(aDate, aTime), self.HomeLong,
+                           self.HomeTZ)
     # solar_noon
 
     def local_sunrise(self, aDate, aTime=datetime.time(0, 0, 0)):
-        hRise = abs(self.HA_sunrise(aDate, aTime))
-        sNoon = abs(self.solar_noon(aDate, aTime))
-        lRise = sNoon - hRise * 4 / 1440
-        # =X2-W2*4/1440
-
-        return lRise
+        return self._rise_set_pair(aDate, aTime)[0]
     # local_sunrise
 
     def local_sunset(self, aDate, aTime=datetime.time(0, 0, 0)):
-        hRise = abs(self.HA_sunrise(aDate, aTime))
-        sNoon = abs(self.solar_noon(aDate, aTime))
-        lSet = sNoon + hRise * 4 / 1440
-        # =X2+W2*4/1440
-
-        return lSet
+        return self._rise_set_pair(aDate, aTime)[1]
     # local_sunset
 
+    # Sunrise and sunset together, sharing the hour angle and solar noon
+    # Returns a tuple of local_sunrise() and local_sunset() results
+    def _rise_set_pair(self, aDate, aTime=datetime.time(0, 0, 0)):
+        return _solar_core(self.julian_century(aDate, aTime),
+                           self._cosHomeLat, self._tanHomeLat, self.HomeLong,
+                           self.HomeTZ)
+    # _rise_set_pair
+
+    # Sunrise for many dates at the same time of day, e.g. a calendar
+    # Returns a list of local_sunrise() results in the order of dates
+    def local_sunrise_batch(self, dates, aTime=datetime.time(0, 0, 0)):
+        return [self._rise_set_pair(aDate, aTime)[0] for aDate in dates]
+    # local_sunrise_batch
+
+    # Sunset for many dates at the same time of day, e.g. a calendar
+    # Returns a list of local_sunset() results in the order of dates
+    def local_sunset_batch(self, dates, aTime=datetime.time(0, 0, 0)):
+        return [self._rise_set_pair(aDate, aTime)[1] for aDate in dates]
+    # local_sunset_batch
+
     def sunlight_duration(self, aDate, aTime=datetime.time(0, 0, 0)):
         sDur = 8 * self.HA_sunrise(aDate, aTime)
         # =8*W2
@@ -649,6 +880,7 @@ class CSTODMath:
     def set_latitude(self, newLat):
         if (newLat >= -90.0) and (newLat <= 90.0):
             self.HomeLat = newLat
+            self._set_home_lat_terms()
 
     def get_longitude(self):
         return self.HomeLong
@@ -670,7 +902,7 @@ class CSTODMath:
             self.HomeLong = newLon
 
     def set_system_time(self):
-        self.systemTime = time.localtime()
+        self.systemTime = self._now_struct()
 
     def get_home_TZ(self):
         return self.HomeTZ
@@ -21,19 +21,22 @@
 # CSDevs. If not, see <https://www.gnu.org/licenses/>.
 #
 
+import ctypes
 import time
 from fcntl import ioctl
+from functools import lru_cache
 from io import BytesIO
 import select
 import mmap
 
 from v4l2py.device import Device
 from v4l2py.raw import (v4l2_buf_type, v4l2_buffer, v4l2_control,
-                        v4l2_queryctrl, v4l2_requestbuffers,
-                        V4L2_BUF_TYPE_VIDEO_CAPTURE, V4L2_MEMORY_MMAP,
-                        VIDIOC_DQBUF, VIDIOC_G_CTRL, VIDIOC_QBUF,
-                        VIDIOC_QUERYBUF, VIDIOC_QUERYCTRL, VIDIOC_REQBUFS,
-                        VIDIOC_S_CTRL, VIDIOC_STREAMOFF, VIDIOC_STREAMON)
+                        v4l2_ext_control, v4l2_ext_controls, v4l2_queryctrl,
+                        v4l2_requestbuffers, V4L2_BUF_TYPE_VIDEO_CAPTURE,
+                        V4L2_MEMORY_MMAP, VIDIOC_DQBUF, VIDIOC_G_CTRL,
+                        VIDIOC_QBUF, VIDIOC_QUERYBUF, VIDIOC_QUERYCTRL,
+                        VIDIOC_REQBUFS, VIDIOC_S_CTRL, VIDIOC_S_EXT_CTRLS,
+                        VIDIOC_STREAMOFF, VIDIOC_STREAMON)
 
 from PySide6.QtCore import (QLoggingCategory, QRunnable, QThread, QThreadPool,
                             qCCritical, qCDebug, qCInfo, qCWarning)
@@ -46,6 +49,26 @@ from PIL import (Image, ImageDraw, ImageFont, ImageStat,
 #                      enable_debug, warning_message, debug_message)
 
 
+# Load a caption font. A capture thread is created for every frame but the
+# caption font rarely changes, so parsed fonts are kept between threads.
+# OSError from a font that can't be loaded isn't cached.
+@lru_cache(maxsize=8)
+def _caption_font(fontFile, fontSize):
+    return ImageFont.truetype(fontFile, fontSize)
+
+
+# Format a caption date and time stamp for the minute since the epoch it's in.
+# Stamps show at most hours and minutes so all captures in a minute share one.
+@lru_cache(maxsize=4)
+def _caption_stamp(stampFormat, epochMinute):
+    return time.strftime(stampFormat, time.localtime(epochMinute * 60))
+
+
+# Frame statistics are whole-frame means, so they are computed on the frame
+# reduced by this factor in each direction (box averaged).
+_STATS_REDUCE = 4
+
+
 # Worker thread to handle stream off and buffer release
 # It needs to own the buffers for as long as it takes to turn the stream off
 # so it needs to own the stream file descriptor as well
@@ -54,20 +77,28 @@ from PIL import (Image, ImageDraw, ImageFont, ImageStat,
 #        so when they overlap operations (capture thread allocating buffers and
 #        StreamOffTask freeing buffers it breaks).
 class StreamOffTask(QRunnable):
-    capDev = None
-    buffers = []
-    req = None
-
     logCategory = QLoggingCategory("csdevs.audio.thread.stream_off")
 
+    def __init__(self):
+        super().__init__()
+
+        # Each task owns its own device, buffers and buffer request
+        self.capDev = None
+        self.buffers = []
+        self.req = None
+
     def run(self):
         taskStart = time.time()
-        activeThreads = QThreadPool.globalInstance().activeThreadCount()
-        maxThreads = QThreadPool.globalInstance().maxThreadCount()
-        msg = "STARTING STREAM OFF POOL with "
-        msg += "{} active threads and {} max".format(activeThreads, maxThreads)
-        qCDebug(self.logCategory, msg)
-        # debug_message(msg)
+        # Only build debug messages when they will be logged
+        logDebug = self.logCategory.isDebugEnabled()
+        if logDebug:
+            activeThreads = QThreadPool.globalInstance().activeThreadCount()
+            maxThreads = QThreadPool.globalInstance().maxThreadCount()
+            msg = "STARTING STREAM OFF POOL with "
+            msg += "{} active threads and {} max".format(activeThreads,
+                                                         maxThreads)
+            qCDebug(self.logCategory, msg)
+            # debug_message(msg)
         try:
             self.__stream_off()
             qCDebug(self.logCategory, "Stream is OFF")
@@ -89,9 +120,10 @@ class StreamOffTask(QRunnable):
                       "Failed attempt to turn stream off with incomplete data")
             # debug_message("Failed attempt to turn stream off with incomplete data")
 
-        taskTime = time.time() - taskStart
-        qCDebug(self.logCategory,
-                "Closer task run duration {}".format(taskTime))
+        if logDebug:
+            taskTime = time.time() - taskStart
+            qCDebug(self.logCategory,
+                    "Closer task run duration {}".format(taskTime))
         # debug_message("Closer task run duration {}".format(taskTime))
 
     @property
@@ -142,8 +174,7 @@ class StreamOffTask(QRunnable):
                     self.req.type = V4L2_BUF_TYPE_VIDEO_CAPTURE
                     self.req.memory = V4L2_MEMORY_MMAP
                     self.req.count = newCount
-                    for iRsv in range(len(self.req.reserved)):
-                        self.req.reserved[iRsv] = 0
+                    # ctypes structures start zeroed, reserved already is
                     # debug_message("Request object populated")
                     ioctl(self.capDev, VIDIOC_REQBUFS, self.req)
                     # debug_message("Request capture buffers success")
@@ -245,11 +276,9 @@ class captureThread(QThread):
 
     lastCaptureElapsed = 0
 
-    buffers = []
     defaultBufCount = 16
     bufCount = 16
     limBufCount = 512
-    req = None
 
     bufToSave = None
     theFrame = None
@@ -266,27 +295,22 @@ class captureThread(QThread):
     # We start with no capture device
     brokenRx = True
 
-    # We can only set controls during stream-on so we need a list of them here
-    # that the thread creater can set
-    controls = []
-
-    # Keep a local cache of control names to save doing V4L2 ioctls
-    ctrlNameCache = {}
-
     # We need special knowledge of auto and manual focus control IDs to manage
     # decision to adjust focus only based on auto-focus being disabled
     focusAutoID = None
     focusManualID = None
 
     # Caption text on the image
-    captionFontOptions = []
     backupCaptionFontFilename = ""
     captionFontSize = 16
     captionText = ""
     captionDateStamp = False
     captionTimeStamp = False
     captionTwoFourHour = False
+    captionStampFormat = ""
     captionLocation = 11
+    captionHPos = 1
+    captionVPos = 1
     captionTextR = 240
     captionTextG = 240
     captionTextB = 240
@@ -297,6 +321,35 @@ class captureThread(QThread):
 
     logCategory = QLoggingCategory("csdevs.audio.thread.worker")
 
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        # Capture buffers and the request for them, owned by this thread
+        self.buffers = []
+        self.req = None
+
+        # File descriptor of the capture device, taken once when the device is
+        # set so the per-frame ioctls don't ask for it every time
+        self.capFd = -1
+
+        # Stream buffer reused for every de-queue, see
+        # __dequeue_capture_frame()
+        self.dqBuf = v4l2_buffer()
+        self.dqBuf.type = V4L2_BUF_TYPE_VIDEO_CAPTURE
+        self.dqBuf.memory = V4L2_MEMORY_MMAP
+
+        # We can only set controls during stream-on so we need a list of them
+        # here that the thread creater can set. Keyed by control ID, in the
+        # order they are to be set.
+        self.controls = {}
+
+        # Keep a local cache of control queries (VIDIOC_QUERYCTRL results) by
+        # control ID to save doing V4L2 ioctls
+        self.ctrlQueryCache = {}
+
+        # Caption font files in order of preference
+        self.captionFontOptions = []
+
     @property
     def exit_time(self):
         '''
@@ -321,7 +374,8 @@ class captureThread(QThread):
         # sub-modules for everything that they can do and we do with v4l2py.raw
 
         self.capDev = aDev
-        self.__clear_control_name_cache()
+        self.capFd = aDev.fileno() if aDev is not None else -1
+        self.__clear_control_query_cache()
         self.brokenRx = (self.capDev is not None)
 
     @property
@@ -561,6 +615,7 @@ class captureThread(QThread):
         '''
 
         self.captionDateStamp = enable
+        self.__update_caption_stamp_format()
 
     def set_caption_timestamp_enabled(self, enable):
         '''
@@ -575,6 +630,7 @@ class captureThread(QThread):
         '''
 
         self.captionTimeStamp = enable
+        self.__update_caption_stamp_format()
 
     def set_caption_two_four_hour_enabled(self, enable):
         '''
@@ -583,6 +639,25 @@ class captureThread(QThread):
         '''
 
         self.captionTwoFourHour = enable
+        self.__update_caption_stamp_format()
+
+    def __update_caption_stamp_format(self):
+        '''
+        Build the time.strftime() format for any date and time stamp in the
+        caption from the datestamp, timestamp and 24 hour settings, so it is
+        only decided when a setting changes.
+        '''
+
+        stampFormats = []
+        if self.captionDateStamp:
+            stampFormats.append("%d %B %Y")
+        if self.captionTimeStamp:
+            if self.captionTwoFourHour:
+                stampFormats.append("%H:%M")
+            else:
+                stampFormats.append("%I:%M")
+
+        self.captionStampFormat = " ".join(stampFormats)
 
     def set_caption_text_location(self, newLoc):
         '''
@@ -604,6 +679,10 @@ class captureThread(QThread):
 
         self.captionLocation = newLoc
 
+        # Decode the location once here rather than for every caption drawn
+        self.captionHPos = newLoc % 10
+        self.captionVPos = int(newLoc / 10)
+
     def set_caption_text_RGB(self, rVal, gVal, bVal):
         '''
         Set the RGB color to be used for the text drawn in any caption being
@@ -699,12 +778,7 @@ class captureThread(QThread):
                 capture.
         '''
 
-        if len(self.controls) > 0:
-            for aCtrl in self.controls:
-                if aCtrl.id == ctrlID:
-                    return aCtrl
-
-        return None
+        return self.controls.get(ctrlID)
 
     def add_control_setting_by_ID(self, ctrlID, value):
         '''
@@ -712,7 +786,7 @@ class captureThread(QThread):
         V4L2 device being used for frame capture. The value is retained in a
         list with all other added control settings and they are used to
         adjust the chosen controls when streaming is started for the V4L2
-        device.
+        device. Adding a control ID already listed replaces its value in place.
 
         Parameters
         ----------
@@ -727,7 +801,7 @@ class captureThread(QThread):
         try:
             aCtrl = v4l2_control(ctrlID)
             aCtrl.value = value
-            self.controls.append(aCtrl)
+            self.controls[ctrlID] = aCtrl
         except TypeError:
             msg = "Capture thread failed to create control {}".format(ctrlID)
             msg += "= {}".format(value)
@@ -749,15 +823,7 @@ class captureThread(QThread):
                 show a message without failing if the ID is not already listed.
         '''
 
-        aCtrl = self.__find_camera_control_setting_by_ID(ctrlID)
-        if aCtrl is not None:
-            try:
-                self.controls.remove(aCtrl)
-            except ValueError:
-                msg = "Failed to remove stream control "
-                msg += "{}".format(aCtrl.id)
-                qCWarning(self.logCategory, msg)
-                # debug_message(msg)
+        self.controls.pop(ctrlID, None)
 
     def replace_control_setting_by_ID(self, ctrlID, newValue):
         '''
@@ -848,7 +914,8 @@ class captureThread(QThread):
     def __get_control_style_by_ID(self, ctrlID):
         '''
         Get the control style for a single V4L2 control by ID for the device
-        being accessed by an instance of this class.
+        being accessed by an instance of this class. The device is only
+        queried the first time for each control ID.
 
         See the V4L2 documentation for VIDIOC_QUERYCTRL to get details
 
@@ -858,12 +925,17 @@ class captureThread(QThread):
                 The V4L2 control ID to get the control style for
         '''
 
+        queryctrl = self.ctrlQueryCache.get(ctrlID)
+        if queryctrl is not None:
+            return queryctrl
+
         try:
             # Create a query control object for the ID and read it
             if self.capDev.closed:
                 raise OSError
             queryctrl = v4l2_queryctrl(ctrlID)
             ioctl(self.capDev, VIDIOC_QUERYCTRL, queryctrl)
+            self.ctrlQueryCache[ctrlID] = queryctrl
         except (TypeError, OSError):
             queryctrl = None
 
@@ -891,46 +963,14 @@ class captureThread(QThread):
 
         return ctrlName
 
-    # FIXME: __clear_control_name_cache() and __get_cached_control_name_by_ID()
-    # have no real purpose. A cache of control ID to name mappings is only
-    # useful if we look up the control name more than once, at present we do it
-    # once to set the controls, which we only do once per-instance of this class
-    def __clear_control_name_cache(self):
-        '''
-        Reset any cache of control ID to name mappings.
-        '''
-        self.ctrlNameCache.clear()
-
-    # Get a control name from it's control ID via a local cache, populate the
-    # entry when not present. This is only useful if we look up the control
-    # name more than once, at present we do it once to set the controls, which
-    # we only do once per-instance of this class
-    def __get_cached_control_name_by_ID(self, ctrlID):
+    # Control names are only used in messages about setting the controls, so
+    # they are looked up (with a VIDIOC_QUERYCTRL) only when a message needs
+    # one and the cache saves repeating that for the same control
+    def __clear_control_query_cache(self):
         '''
-        Given a control ID supported by the current object's V4L2 device get the
-        name of the control first from a local cache and only use the V4L2 API
-        if that fails
-
-        Parameters
-        ----------
-            ctrlID: Integer
-                The V4L2 control ID for a control supported by the V4L2 device
-                accessed by the current instance of the class
-
-        Returns a String containing the name used for the control ID, if
-        supported
-
-        If the control ID is not supported should raise a ValueError for the
-        invalid ID.
+        Reset any cache of control ID to control query mappings.
         '''
-
-        try:
-            ctrlName = self.ctrlNameCache[ctrlID]
-        except KeyError:
-            ctrlName = self.__get_control_name_by_ID(ctrlID)
-            self.ctrlNameCache[ctrlID] = ctrlName
-
-        return ctrlName
+        self.ctrlQueryCache.clear()
 
     def __get_control_value_by_ID(self, ctrlID):
         '''
@@ -985,9 +1025,8 @@ class captureThread(QThread):
                 afIsOn = (self.__get_control_value_by_ID(self.focusAutoID) != 0)
                 # debug_message("AF is ON: {}".format(afIsOn))
 
-                # We'll need the control name later and if we want it is in the
-                # control setting list for this instance
-                afCtrlName = self.__get_control_name_by_ID(self.focusAutoID)
+                # See if we want it set in the control setting list for this
+                # instance
                 # debug_message("AF Ctrl is: ({}) {}".format(self.focusAutoID, afCtrlName))
                 afCtrl = self.__find_camera_control_setting_by_ID(self.focusAutoID)
                 if (afCtrl is not None):
@@ -1018,16 +1057,18 @@ class captureThread(QThread):
                 # It may be useful to set AF ON then OFF if we have manual focus
                 # but that may require leaving it ON for a short time.
 
-            # Text showing the controls we've set
+            # Text showing the controls we've set, only built when it will be
+            # logged because it needs the control names
+            logControls = self.logCategory.isDebugEnabled()
             ctrlVals = ""
 
-            # Go through the settings
-            for aCtrl in self.controls:
-                # We only set the controls once before exiting, so a cache
-                # of the names doesn't help if we populate it here
-                ctrlName = self.__get_control_name_by_ID(aCtrl.id)
-                # ctrlName = self.__get_cached_control_name_by_ID(aCtrl.id)
+            # The controls to set, in order. Turning auto-focus off before
+            # setting manual focus is kept apart from the rest.
+            afOffCtrls = []
+            otherCtrls = []
 
+            # Go through the settings
+            for aCtrl in self.controls.values():
                 # Prevent setting of focus if auto-focus is to be enabled
                 if afWantOn is not None:
                     if afWantOn and (aCtrl.id == self.focusManualID):
@@ -1040,46 +1081,123 @@ class captureThread(QThread):
                     # if it's already on and we are trying to set manual focus
                     if (not afWantOn) and afIsOn and\
                             (aCtrl.id == self.focusManualID):
-                        try:
-                            # Assumed bool, 0 is off
-                            newCtrl = v4l2_control(self.focusAutoID)
-                            newCtrl.value = 0
-                            ioctl(self.capDev.fileno(), VIDIOC_S_CTRL, newCtrl)
+                        # Assumed bool, 0 is off
+                        newCtrl = v4l2_control(self.focusAutoID)
+                        newCtrl.value = 0
+                        afOffCtrls.append(newCtrl)
+                        if logControls:
+                            afCtrlName = self.__get_control_name_by_ID(self.focusAutoID)
                             ctrlVals += " \\_ ({} {} = {})".format(newCtrl.id,
                                                                  afCtrlName,
                                                                  newCtrl.value)
-                            newCtrl = None
-                        except:
-                            msg = " Set {} off failed ".format(afCtrlName)
-                            msg += "before set {}".format(ctrlName)
-                            qCWarning(self.logCategory, msg)
-                            # debug_message(msg)
-                            # Can't set focus below
-                            continue
                     # else:
                     #     if (not afWantOn):
                     #         if (not afIsOn):
                     #             if (aCtrl.id == self.focusManualID):
                     #                 debug_message("AF Wanted off, IS off and we want to set MF, no-op with AF")
 
-                try:
+                if logControls:
+                    ctrlName = self.__get_control_name_by_ID(aCtrl.id)
                     ctrlVals += " \\_ {} {} = {}".format(aCtrl.id, ctrlName,
                                                          aCtrl.value)
-                    newCtrl = v4l2_control(aCtrl.id)
-                    newCtrl.value = aCtrl.value
-                    ioctl(self.capDev.fileno(), VIDIOC_S_CTRL, newCtrl)
-                    newCtrl = None
-                # except (TypeError, OSError):
-                except:
-                    qCWarning(self.logCategory,
-                              " Set {} failed".format(ctrlName))
-                    # debug_message(" Set {} failed".format(ctrlName))
+                otherCtrls.append(aCtrl)
+
+            # Set them in as few ioctls as possible, if the device won't then
+            # one at a time. Turning auto-focus off has to be done before
+            # setting manual focus so it's set first on it's own, if it fails
+            # manual focus isn't set.
+            if len(afOffCtrls) > 0:
+                if not self.__set_controls_batch(afOffCtrls) and\
+                        not self.__set_controls_singly(afOffCtrls, True):
+                    otherCtrls = [aCtrl for aCtrl in otherCtrls
+                                  if aCtrl.id != self.focusManualID]
+            if not self.__set_controls_batch(otherCtrls):
+                self.__set_controls_singly(otherCtrls)
+
             if ctrlVals != "":
                 qCDebug(self.logCategory, ctrlVals)
                 # debug_message(ctrlVals)
             qCDebug(self.logCategory, "__")
             # debug_message("__")
 
+    def __set_controls_batch(self, ctrls):
+        '''
+        Set a list of controls on the current object's in-use V4L2 device with
+        a single VIDIOC_S_EXT_CTRLS, in list order.
+
+        Parameters
+        ----------
+            ctrls: List
+                The v4l2_control objects with the ID and value to set
+
+        Returns True if every control was set, else False
+        '''
+
+        nCtrls = len(ctrls)
+        if nCtrls == 0:
+            return True
+
+        try:
+            extCtrls = (v4l2_ext_control * nCtrls)()
+            for iCtrl, aCtrl in enumerate(ctrls):
+                extCtrls[iCtrl].id = aCtrl.id
+                extCtrls[iCtrl].value = aCtrl.value
+
+            # A zero control class (V4L2_CTRL_WHICH_CUR_VAL) sets the current
+            # values of controls from any class
+            ext = v4l2_ext_controls()
+            ext.count = nCtrls
+            ext.controls = ctypes.cast(extCtrls,
+                                       ctypes.POINTER(v4l2_ext_control))
+            ioctl(self.capDev.fileno(), VIDIOC_S_EXT_CTRLS, ext)
+        except (TypeError, OSError) as e:
+            if self.logCategory.isDebugEnabled():
+                msg = "Set {} controls together failed".format(nCtrls)
+                if type(e) == OSError:
+                    msg += ", OS error: {}".format(e.errno)
+                qCDebug(self.logCategory, msg)
+                # debug_message(msg)
+            return False
+
+        return True
+
+    def __set_controls_singly(self, ctrls, afOff=False):
+        '''
+        Set a list of controls on the current object's in-use V4L2 device one
+        VIDIOC_S_CTRL at a time, in list order.
+
+        Parameters
+        ----------
+            ctrls: List
+                The v4l2_control objects with the ID and value to set
+            afOff: Boolean
+                True if the controls are turning auto-focus off before setting
+                manual focus, only used in failure messages
+
+        Returns True if every control was set, else False
+        '''
+
+        allSet = True
+        for aCtrl in ctrls:
+            try:
+                newCtrl = v4l2_control(aCtrl.id)
+                newCtrl.value = aCtrl.value
+                ioctl(self.capDev.fileno(), VIDIOC_S_CTRL, newCtrl)
+                newCtrl = None
+            except (TypeError, OSError):
+                allSet = False
+                ctrlName = self.__get_control_name_by_ID(aCtrl.id)
+                if afOff:
+                    mfName = self.__get_control_name_by_ID(self.focusManualID)
+                    msg = " Set {} off failed ".format(ctrlName)
+                    msg += "before set {}".format(mfName)
+                else:
+                    msg = " Set {} failed".format(ctrlName)
+                qCWarning(self.logCategory, msg)
+                # debug_message(msg)
+
+        return allSet
+
     def __request_capture_buffers(self, newCount):
         '''
         Request capture memory buffers to be used when streaming from the
@@ -1101,8 +1219,7 @@ class captureThread(QThread):
                     self.req.type = V4L2_BUF_TYPE_VIDEO_CAPTURE
                     self.req.memory = V4L2_MEMORY_MMAP
                     self.req.count = newCount
-                    for iRsv in range(len(self.req.reserved)):
-                        self.req.reserved[iRsv] = 0
+                    # ctypes structures start zeroed, reserved already is
                     # debug_message("Request object populated")
                     ioctl(self.capDev, VIDIOC_REQBUFS, self.req)
                     # debug_message("Request capture buffers success")
@@ -1167,11 +1284,13 @@ class captureThread(QThread):
             try:
                 if not self.capDev.closed:
                     # debug_message("mapping {} buffers".format(self.req.count))
+                    # One stream buffer is used to query and queue each buffer
+                    # in turn, VIDIOC_QUERYBUF fills in the rest for the index
+                    buf = v4l2_buffer()
+                    buf.type = V4L2_BUF_TYPE_VIDEO_CAPTURE
+                    buf.memory = V4L2_MEMORY_MMAP
                     for ind in range(self.req.count):
                         # setup a buffer
-                        buf = v4l2_buffer()
-                        buf.type = V4L2_BUF_TYPE_VIDEO_CAPTURE
-                        buf.memory = V4L2_MEMORY_MMAP
                         buf.index = ind
                         # iRes = ioctl(self.capDev, VIDIOC_QUERYBUF, buf)
                         ioctl(self.capDev, VIDIOC_QUERYBUF, buf)
@@ -1182,9 +1301,9 @@ class captureThread(QThread):
                         #     msg ++ "buffer: {}".format(iRes)
                         #     debug_message(msg)
 
+                        # Frames are only read from capture buffers
                         mm = mmap.mmap(self.capDev.fileno(), buf.length,
-                                       mmap.MAP_SHARED,
-                                       mmap.PROT_READ | mmap.PROT_WRITE,
+                                       mmap.MAP_SHARED, mmap.PROT_READ,
                                        offset=buf.m.offset)
                         self.buffers.append(mm)
                         # debug_message("Appended buffer")
@@ -1276,16 +1395,18 @@ class captureThread(QThread):
         De-queue the next un-accessed, filled capture buffer from the V4L2
         device stream. Provide access as a capture frame memory map.
 
-        Returns the result of a VIDIOC_DQBUF request to the device.
+        Returns the result of a VIDIOC_DQBUF request to the device. It's the
+        same stream buffer object every time, only one buffer is de-queued at a
+        time and it must be re-queued before the next de-queue.
         '''
 
         try:
+            # The main window can close the device and a re-open can get the
+            # same descriptor number, check it's still open before using it
             if not self.capDev.closed:
-                buf = v4l2_buffer()
-                buf.type = V4L2_BUF_TYPE_VIDEO_CAPTURE
-                buf.memory = V4L2_MEMORY_MMAP
+                buf = self.dqBuf
                 # iRes = ioctl(self.capDev.fileno(), VIDIOC_DQBUF, buf)
-                ioctl(self.capDev.fileno(), VIDIOC_DQBUF, buf)
+                ioctl(self.capFd, VIDIOC_DQBUF, buf)
             else:
                 qCDebug(self.logCategory, "Parse frame, no capture device")
                 # debug_message("Parse frame, no capture device")
@@ -1322,7 +1443,7 @@ class captureThread(QThread):
             mm = self.buffers[buf.index]
             mm.seek(0)
             # iRes = ioctl(self.capDev, VIDIOC_QBUF, buf)
-            ioctl(self.capDev, VIDIOC_QBUF, buf)
+            ioctl(self.capFd, VIDIOC_QBUF, buf)
         except (IndexError, OSError) as e:
             qCWarning(self.logCategory,
                       "Failed to re-queue frame {}".format(buf.index))
@@ -1332,12 +1453,31 @@ class captureThread(QThread):
                 # debug_message("\\_ OS error: {}".format(e.errno))
             self.brokenRx = True
 
+    def __frame_bytes_used(self, buf, mm):
+        '''
+        Return the number of bytes of frame data in a de-queued capture buffer.
+        That's the number the device reports using, or the whole buffer if it
+        reports none or more than the buffer length.
+
+        Parameters
+        ----------
+            buf: A V4L2 stream buffer
+                The result of a previous use of __dequeue_capture_frame()
+            mm: mmap
+                The memory map of the capture buffer at buf.index
+        '''
+
+        used = buf.bytesused
+        if (used <= 0) or (used > len(mm)):
+            used = len(mm)
+
+        return used
+
     def __mean_stat(self, imgStat):
         '''
-        Given a list of statistics, compute the mean of all in the list. It's
-        faster to count while iterating the entries because using something
-        like count = len(imgStat) means we iterate imgStat twice, one time for
-        count and one time for getting the sum of imgStat
+        Given a list of statistics, compute the mean of all in the list. The
+        ImageStat values are lists, len() doesn't iterate them and sum() adds
+        them up in C.
 
         Parameters
         ----------
@@ -1346,16 +1486,11 @@ class captureThread(QThread):
         Returns the mean of the values in imgStat
         '''
 
-        result = 0.0
-        count = 0
-        for aVal in imgStat:
-            result += aVal
-            count += 1
-
+        count = len(imgStat)
         if count > 0:
-            result /= 1.0 * count
+            return sum(imgStat) / count
 
-        return result
+        return 0.0
 
     def __compute_frame_statistics(self):
         '''
@@ -1375,14 +1510,19 @@ class captureThread(QThread):
                 # it's only one frame of many frames received
                 tp1 = time.time()
 
+                # The statistics don't need every pixel, use a box averaged
+                # reduction of the frame. Means are unchanged, standard
+                # deviation (contrast) comes out a little lower.
+                statFrame = self.theFrame.reduce(_STATS_REDUCE)
+
                 # Image is RGB, get it's stats
-                rgbStat = ImageStat.Stat(self.theFrame)
+                rgbStat = ImageStat.Stat(statFrame)
 
                 # Make a HSV pillow image from the RGB one. HSV gives us
                 # saturation from the S-band mean and brightness from the V-band
                 # mean but contrast is easiest as mean of standard deviation for
                 # all bands. Shame we have to convert from RGB to get HSV.
-                hsvImage = self.theFrame.convert("HSV")
+                hsvImage = statFrame.convert("HSV")
 
                 # Get the statistics of the HSV image
                 hsvStat = ImageStat.Stat(hsvImage)
@@ -1438,12 +1578,15 @@ class captureThread(QThread):
         try:
             # debug_message("Saving frame to {}".format(self.saveFile))
             mm = self.buffers[buf.index]
+            used = self.__frame_bytes_used(buf, mm)
             # debug_message("mmap buffer")
-            vid = open(self.saveFile, "wb+")
-            # debug_message("write buffer")
-            vid.write(mm.read())
-            # debug_message("close save file")
-            vid.close()
+            # Write only, write straight from the map. The view must be
+            # released before the buffer can be closed. A buffered write of
+            # more than the buffer size goes straight to the file.
+            with open(self.saveFile, "wb") as vid,\
+                    memoryview(mm)[:used] as frameView:
+                # debug_message("write buffer")
+                vid.write(frameView)
             # debug_message("Save finished")
 
             # tImgStats = self.__compute_frame_statistics(mm)
@@ -1465,27 +1608,15 @@ class captureThread(QThread):
         saved. An empty String is no-cpation.
         '''
 
-        captionRecord = ""
-
-        # If there is anything to log on the captured image as a caption
-        padFields = (self.captionText != "")
-        if (padFields) or self.captionDateStamp or\
-                self.captionTimeStamp:
-            # Generate the caption string
-            captionRecord = self.captionText
-            if self.captionDateStamp:
-                if padFields:
-                    captionRecord += " "
-                else:
-                    padFields = True
-                captionRecord += time.strftime("%d %B %Y")
-            if self.captionTimeStamp:
-                if padFields:
-                    captionRecord += " "
-                if self.captionTwoFourHour:
-                    captionRecord += time.strftime("%H:%M")
-                else:
-                    captionRecord += time.strftime("%I:%M")
+        # Caption text followed by any date and time stamp, see
+        # __update_caption_stamp_format()
+        captionRecord = self.captionText
+        if self.captionStampFormat != "":
+            if captionRecord != "":
+                captionRecord += " "
+            epochMinute = int(time.time() // 60)
+            captionRecord += _caption_stamp(self.captionStampFormat,
+                                            epochMinute)
 
         return captionRecord
 
@@ -1503,7 +1634,7 @@ class captureThread(QThread):
                 Frame image width
         '''
 
-        hPos = self.captionLocation % 10
+        hPos = self.captionHPos
 
         # Center
         if hPos == 2:
@@ -1535,7 +1666,7 @@ class captureThread(QThread):
                 Frame image height
         '''
 
-        vPos = int(self.captionLocation / 10)
+        vPos = self.captionVPos
 
         # Center
         if vPos == 2:
@@ -1614,8 +1745,12 @@ class captureThread(QThread):
         '''
 
         try:
+            # Only the bytes the device filled hold the frame. Slicing the map
+            # copies them once into a bytes object that BytesIO shares rather
+            # than copying again.
             mm = self.buffers[buf.index]
-            self.theFrame = Image.open(BytesIO(mm.read()))
+            used = self.__frame_bytes_used(buf, mm)
+            self.theFrame = Image.open(BytesIO(mm[:used]))
         except (IndexError, OSError, TypeError,
                 UnidentifiedImageError, ValueError) as e:
             qCWarning(self.logCategory, "Load frame FAILED")
@@ -1655,7 +1790,7 @@ class captureThread(QThread):
                         for fFont in self.captionFontOptions:
                             if fFont is not None:
                                 try:
-                                    recordFont = ImageFont.truetype(fFont, self.captionFontSize)
+                                    recordFont = _caption_font(fFont, self.captionFontSize)
                                     # debug_message("ImageFont from: {}".format(fFont))
                                     # fontName = recordFont.getname()
                                     # debug_message("Default ImageFont is {} {}".format(fontName[0], fontName[1]))
@@ -1742,11 +1877,22 @@ class captureThread(QThread):
             #     debug_message(msg)
 
             # The following loop could run for more than a second but it uses
-            # select with a max_t seconds timeout so there is little reason to
+            # poll with a max_t seconds timeout so there is little reason to
             # program it to yield
             curFrame = 0
             max_t = 10.0
 
+            # Wait for frames with a poll object registered once for the loop,
+            # select would rebuild it's descriptor sets for every frame
+            framePoll = select.poll()
+            framePoll.register(self.capFd, select.POLLIN)
+            max_ms = int(max_t * 1000)
+
+            # Methods used for every frame, as local names
+            pollFrame = framePoll.poll
+            dequeueFrame = self.__dequeue_capture_frame
+            requeueFrame = self.__requeue_frame
+
             # Read frames until we reach the required one or fail
             while not self.capDev.closed and (curFrame <= self.capFrame):
                 # Set camera controls at the chosen frame
@@ -1756,20 +1902,13 @@ class captureThread(QThread):
                     # debug_message("APPLYING CONTROLS at frame {}".format(curFrame))
                     self.__set_controls()
 
-                # FIXME: We ought to use in_error to decide if we can exit error
-                # We already handle ready_to_read and loop if we aren't, i.e.
-                # nothing to do and select just timed-out
-                ready_to_read, ready_to_write, in_error = ([], [], [])
-                selFiles = [self.capDev.fileno()]
-                ready_to_read,\
-                    ready_to_write,\
-                    in_error = select.select(selFiles, [], [], max_t)
-
-                if len(ready_to_read) > 0:
-                    if len(ready_to_read) > 1:
-                        qCDebug(self.logCategory, "MULTIPLE FRAMES RECEIVED")
-                        # debug_message("MULTIPLE FRAMES RECEIVED")
-                    buf = self.__dequeue_capture_frame()
+                # FIXME: We ought to use POLLERR to decide if we can exit error
+                # As with select, an error event is treated as ready to read
+                # and the de-queue fails. No events means poll timed-out.
+                frameEvents = pollFrame(max_ms)
+
+                if len(frameEvents) > 0:
+                    buf = dequeueFrame()
                     if buf is None:
                         qCWarning(self.logCategory,
                                   "Frame {} Rx failed".format(curFrame))
@@ -1778,27 +1917,16 @@ class captureThread(QThread):
 
                     # debug_message("Frame Rx in buffer {}".format(buf.index))
                     if curFrame != self.capFrame:
-                        self.__requeue_frame(buf)
+                        requeueFrame(buf)
                         curFrame += 1
                     else:
                         self.bufToSave = buf
                         return 0
                 else:
-                    # See what is the state when select finishes with no
-                    # ready to read (usually a timeout)
-                    if (len(ready_to_read) == 0) and\
-                            (len(ready_to_write) == 0) and\
-                            (len(in_error) == 0):
-                        qCWarning(self.logCategory, "Camera frame read timeout")
-                        # debug_message("Camera frame read timeout")
-                        return -2
-                    else:
-                        qCWarning(self.logCategory,
-                                  "select(): read "
-                                  "{}, write {}, error {}".format(ready_to_read,
-                                                                  ready_to_write,
-                                                                  in_error))
-                        # debug_message("select(): read {}, write {}, error {}".format(ready_to_read, ready_to_write, in_error))
+                    # Nothing is ready when poll finishes, a timeout
+                    qCWarning(self.logCategory, "Camera frame read timeout")
+                    # debug_message("Camera frame read timeout")
+                    return -2
 
         return -3
 
@@ -1809,13 +1937,16 @@ class captureThread(QThread):
         from QThread.
         '''
 
-        qCDebug(self.logCategory, "")
-        # debug_message("")
-        msg = "Capturing frame {}".format(self.capFrame)
-        if self.save_capture_frame:
-            msg += " to {}".format(self.saveFile)
-        qCDebug(self.logCategory, msg)
-        # debug_message(msg)
+        # Only build debug messages when they will be logged
+        logDebug = self.logCategory.isDebugEnabled()
+        if logDebug:
+            qCDebug(self.logCategory, "")
+            # debug_message("")
+            msg = "Capturing frame {}".format(self.capFrame)
+            if self.save_capture_frame:
+                msg += " to {}".format(self.saveFile)
+            qCDebug(self.logCategory, msg)
+            # debug_message(msg)
 
         # We must have a capture device and frame number to capture (but it
         # doesn't matter if we have a save frame name, we can capture without
@@ -1842,9 +1973,10 @@ class captureThread(QThread):
                 if self.req is not None:
                     if len(self.buffers) > 0:
                         tStrmOn = time.time()
-                        qCDebug(self.logCategory,
-                                "Capture thread turning stream on with "
-                                "{} buffers".format(len(self.buffers)))
+                        if logDebug:
+                            qCDebug(self.logCategory,
+                                    "Capture thread turning stream on with "
+                                    "{} buffers".format(len(self.buffers)))
                         # debug_message("Capture thread turning stream on with {} buffers".format(len(self.buffers)))
                         self.__stream_on()
 
@@ -1930,34 +2062,35 @@ class captureThread(QThread):
                 if self.save_capture_frame:
                     self.lastCaptureElapsed = elapsed
 
-                # Show the elapsed times
-                msg = "CAPTURE TIMING: elapsed {:.6f}s".format(elapsed)
-                qCDebug(self.logCategory, msg)
-                # debug_message(msg)
-                msg = " \\ t: frames {:.6f}, ".format(wElapsed)
-                msg += "setup {:.6f}, ".format(sElapsed)
-                msg += "stream ON {:.6f}, ".format(onElapsed)
-                msg += "OFF {:.6f}, ".format(offElapsed)
-                msg += "from buf {:.6f}, ".format(ldElapsed)
-                msg += "save {:.6f}, ".format(svElapsed)
-                msg += "cleanup {:.6f}, ".format(cElapsed)
-                msg += "stats gen. {:.6f}, ".format(tImgStats)
-                qCDebug(self.logCategory, msg)
-                # debug_message(msg)
-
-                # Show each element as a percentage of total time
-                percFrac = 100.0 / elapsed
-                msg = " \\ %: frames {:.3f}, ".format(wElapsed * percFrac)
-                msg += "setup {:.3f}, ".format(sElapsed * percFrac)
-                msg += "stream ON {:.3f}, ".format(onElapsed * percFrac)
-                msg += "OFF {:.3f}, ".format(offElapsed * percFrac)
-                msg += "from buf {:.3f}, ".format(ldElapsed * percFrac)
-                msg += "save {:.3f}, ".format(svElapsed * percFrac)
-                msg += "cleanup {:.3f}, ".format(cElapsed * percFrac)
-                msg += "stats gen. {:.3f}".format(tImgStats * percFrac)
-                qCDebug(self.logCategory, msg)
-                # debug_message(msg)
-                # warning_message(msg)
+                # Show the elapsed times, if they will be logged
+                if logDebug:
+                    msg = "CAPTURE TIMING: elapsed {:.6f}s".format(elapsed)
+                    qCDebug(self.logCategory, msg)
+                    # debug_message(msg)
+                    msg = " \\ t: frames {:.6f}, ".format(wElapsed)
+                    msg += "setup {:.6f}, ".format(sElapsed)
+                    msg += "stream ON {:.6f}, ".format(onElapsed)
+                    msg += "OFF {:.6f}, ".format(offElapsed)
+                    msg += "from buf {:.6f}, ".format(ldElapsed)
+                    msg += "save {:.6f}, ".format(svElapsed)
+                    msg += "cleanup {:.6f}, ".format(cElapsed)
+                    msg += "stats gen. {:.6f}, ".format(tImgStats)
+                    qCDebug(self.logCategory, msg)
+                    # debug_message(msg)
+
+                    # Show each element as a percentage of total time
+                    percFrac = 100.0 / elapsed
+                    msg = " \\ %: frames {:.3f}, ".format(wElapsed * percFrac)
+                    msg += "setup {:.3f}, ".format(sElapsed * percFrac)
+                    msg += "stream ON {:.3f}, ".format(onElapsed * percFrac)
+                    msg += "OFF {:.3f}, ".format(offElapsed * percFrac)
+                    msg += "from buf {:.3f}, ".format(ldElapsed * percFrac)
+                    msg += "save {:.3f}, ".format(svElapsed * percFrac)
+                    msg += "cleanup {:.3f}, ".format(cElapsed * percFrac)
+                    msg += "stats gen. {:.3f}".format(tImgStats * percFrac)
+                    qCDebug(self.logCategory, msg)
+                    # debug_message(msg)
+                    # warning_message(msg)
             except Exception as e:
                 qCWarning(self.logCategory,
                           "Capture run failed: {}".format(type(e)))
@@ -1975,6 +2108,7 @@ class captureThread(QThread):
 
         # Thread will end, abandon state and log exit time
         self.capDev = None
+        self.capFd = -1
         qCDebug(self.logCategory, "-- Result ready...")
         # debug_message("-- Result ready...")
         self.tThreadExit = time.time()
@@ -1987,13 +2121,16 @@ class captureThread(QThread):
         from QThread.
         '''
 
-        qCDebug(self.logCategory, "")
-        # debug_message("")
-        msg = "Capturing frame {}".format(self.capFrame)
-        if self.save_capture_frame:
-            msg += " to {}".format(self.saveFile)
-        qCDebug(self.logCategory, msg)
-        # debug_message(msg)
+        # Only build debug messages when they will be logged
+        logDebug = self.logCategory.isDebugEnabled()
+        if logDebug:
+            qCDebug(self.logCategory, "")
+            # debug_message("")
+            msg = "Capturing frame {}".format(self.capFrame)
+            if self.save_capture_frame:
+                msg += " to {}".format(self.saveFile)
+            qCDebug(self.logCategory, msg)
+            # debug_message(msg)
 
         # We must have a capture device and frame number to capture (but it
         # doesn't matter if we have a save frame name, we can capture without
@@ -2086,38 +2223,39 @@ class captureThread(QThread):
                 if self.save_capture_frame:
                     self.lastCaptureElapsed = elapsed
 
-                # Show the elapsed times
-                msg = "CAPTURE TIMING: elapsed {:.6f}s".format(elapsed)
-                qCDebug(self.logCategory, msg)
-                # debug_message(msg)
-                msg = " \\ t: frames {:.6f}, ".format(wElapsed)
-                msg += "setup {:.6f}, ".format(sElapsed)
-                msg += "stream ON {:.6f}, ".format(onElapsed)
-                msg += "OFF {:.6f}, ".format(offElapsed)
-                msg += "from buf {:.6f}, ".format(ldElapsed)
-                msg += "save {:.6f}, ".format(svElapsed)
-                msg += "cleanup {:.6f}, ".format(cElapsed)
-                msg += "buffers CLOSE {:.6f}, ".format(cClose)
-                msg += "RELEASE {:.6f}, ".format(cRelease)
-                msg += "stats gen. {:.6f}, ".format(tImgStats)
-                qCDebug(self.logCategory, msg)
-                # debug_message(msg)
-
-                # Show each element as a percentage of total time
-                percFrac = 100.0 / elapsed
-                msg = " \\ %: frames {:.3f}, ".format(wElapsed * percFrac)
-                msg += "setup {:.3f}, ".format(sElapsed * percFrac)
-                msg += "stream ON {:.3f}, ".format(onElapsed * percFrac)
-                msg += "OFF {:.3f}, ".format(offElapsed * percFrac)
-                msg += "from buf {:.3f}, ".format(ldElapsed * percFrac)
-                msg += "save {:.3f}, ".format(svElapsed * percFrac)
-                msg += "cleanup {:.3f}, ".format(cElapsed * percFrac)
-                msg += "buffers CLOSE {:.3f}, ".format(cClose * percFrac)
-                msg += "RELEASE {:.3f}, ".format(cRelease * percFrac)
-                msg += "stats gen. {:.3f}".format(tImgStats * percFrac)
-                qCDebug(self.logCategory, msg)
-                # debug_message(msg)
-                # warning_message(msg)
+                # Show the elapsed times, if they will be logged
+                if logDebug:
+                    msg = "CAPTURE TIMING: elapsed {:.6f}s".format(elapsed)
+                    qCDebug(self.logCategory, msg)
+                    # debug_message(msg)
+                    msg = " \\ t: frames {:.6f}, ".format(wElapsed)
+                    msg += "setup {:.6f}, ".format(sElapsed)
+                    msg += "stream ON {:.6f}, ".format(onElapsed)
+                    msg += "OFF {:.6f}, ".format(offElapsed)
+                    msg += "from buf {:.6f}, ".format(ldElapsed)
+                    msg += "save {:.6f}, ".format(svElapsed)
+                    msg += "cleanup {:.6f}, ".format(cElapsed)
+                    msg += "buffers CLOSE {:.6f}, ".format(cClose)
+                    msg += "RELEASE {:.6f}, ".format(cRelease)
+                    msg += "stats gen. {:.6f}, ".format(tImgStats)
+                    qCDebug(self.logCategory, msg)
+                    # debug_message(msg)
+
+                    # Show each element as a percentage of total time
+                    percFrac = 100.0 / elapsed
+                    msg = " \\ %: frames {:.3f}, ".format(wElapsed * percFrac)
+                    msg += "setup {:.3f}, ".format(sElapsed * percFrac)
+                    msg += "stream ON {:.3f}, ".format(onElapsed * percFrac)
+                    msg += "OFF {:.3f}, ".format(offElapsed * percFrac)
+                    msg += "from buf {:.3f}, ".format(ldElapsed * percFrac)
+                    msg += "save {:.3f}, ".format(svElapsed * percFrac)
+                    msg += "cleanup {:.3f}, ".format(cElapsed * percFrac)
+                    msg += "buffers CLOSE {:.3f}, ".format(cClose * percFrac)
+                    msg += "RELEASE {:.3f}, ".format(cRelease * percFrac)
+                    msg += "stats gen. {:.3f}".format(tImgStats * percFrac)
+                    qCDebug(self.logCategory, msg)
+                    # debug_message(msg)
+                    # warning_message(msg)
             except Exception as e:
                 qCWarning(self.logCategory,
                           "Capture run failed: {}".format(type(e)))
@@ -2135,6 +2273,7 @@ class captureThread(QThread):
 
         # Thread will end, abandon state and log exit time
         self.capDev = None
+        self.capFd = -1
         qCDebug(self.logCategory, "-- Result ready...")
         # debug_message("-- Result ready...")
         self.tThreadExit = time.time()
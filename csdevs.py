@@ -6116,7 +6116,8 @@ class CSDevs(QDialog):
                                                       reloadAsked)
                     reloadAsked = True
                     if reloadFonts:
-                        self.theFonts.load_font_lists()
+                        # Scan again even if the font directories look unchanged
+                        self.theFonts.load_font_lists(force=True)
                     else:
                         # Strictly untrue but make the loop exit at while
                         fontFound = True
@@ -6474,4 +6475,8 @@ if __name__ == "__main__":
     widget = CSDevs()
     widget.show()
     # sys.exit(app.exec_())
-    sys.exit(app.exec())
+    appResult = app.exec()
+
+    # Keep the caption font lookups made for the next start
+    widget.theFonts.save_font_lookups()
+    sys.exit(appResult)